@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the build and checks on a synthetic project
+
+A project is generated with benchmarks/synthetic.py and each of these is
+timed on its own, taking the best of a few runs:
+
+    build_data        the whole build, into an empty site directory
+    check_all_csv     the data checks
+    check_all_meta    the metadata checks
+    edge_detection    sdg.edges.edge_detection on every indicator
+    df_to_list_dict   sdg.json.df_to_list_dict on every indicator
+    df_to_json        sdg.json.df_to_json on every indicator
+
+Save the timings as a baseline before a change and compare with it after.
+Anything slower than the baseline by more than the tolerance is a
+regression, and the script exits with status 1. Compare like with like:
+the same machine and the same project options.
+
+With the sdg package installed, run from the repository root:
+
+    python benchmarks/bench_build.py --save baseline.json
+    python benchmarks/bench_build.py --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import sdg
+from sdg.data import get_inid_data
+from sdg.edges import edge_detection
+from sdg.json import df_to_list_dict, df_to_json
+from synthetic import make_project, add_arguments, project_options
+
+# %% Timings
+
+
+def quiet(func, *args, **kwargs):
+    """Call func without printing its messages"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def best_time(func, repeat=3):
+    """The fastest of repeat calls, in seconds"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def run_benchmarks(src_dir, ids, repeat=3):
+    """Time each stage on the project in src_dir
+
+    Returns:
+        dict of name to seconds
+    """
+    site_dir = os.path.join(src_dir, '_site')
+
+    def build():
+        # From scratch, or the unchanged outputs would be skipped
+        if os.path.exists(site_dir):
+            shutil.rmtree(site_dir)
+        assert quiet(sdg.build_data, src_dir=src_dir, site_dir=site_dir, git=False)
+
+    frames = {inid: get_inid_data(inid, src_dir=src_dir) for inid in ids}
+
+    def for_each(func):
+        def run():
+            for inid, df in frames.items():
+                func(inid, df)
+        return run
+
+    timings = dict()
+    timings['build_data'] = best_time(build, repeat)
+    timings['check_all_csv'] = best_time(
+        lambda: quiet(sdg.check_all_csv, src_dir=src_dir), repeat)
+    timings['check_all_meta'] = best_time(
+        lambda: quiet(sdg.check_all_meta, src_dir=src_dir), repeat)
+    timings['edge_detection'] = best_time(for_each(edge_detection), repeat)
+    timings['df_to_list_dict'] = best_time(
+        for_each(lambda inid, df: df_to_list_dict(df, orient='records')), repeat)
+    timings['df_to_json'] = best_time(
+        for_each(lambda inid, df: df_to_json(df, orient='records')), repeat)
+    return timings
+
+# %% Baseline
+
+
+def save_baseline(pth, options, timings):
+    with open(pth, 'w', encoding='utf-8') as f:
+        json.dump({'options': options, 'timings': timings}, f, indent=2, sort_keys=True)
+
+
+def load_baseline(pth):
+    with open(pth, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline, timings, tolerance=0.2):
+    """Print the timings next to the baseline
+
+    Args:
+        baseline: dict of name to seconds
+        timings: dict of name to seconds
+        tolerance: float. How much slower, as a fraction, is allowed
+
+    Returns:
+        list: The names that got slower by more than the tolerance
+    """
+    regressions = list()
+    print('%-16s %12s %12s %8s' % ('', 'baseline (s)', 'now (s)', 'change'))
+    for name, seconds in timings.items():
+        if name not in baseline:
+            print('%-16s %12s %12.4f' % (name, '-', seconds))
+            continue
+        change = seconds / baseline[name] - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  SLOWER'
+        print('%-16s %12.4f %12.4f %+7.0f%%%s' %
+              (name, baseline[name], seconds, 100 * change, flag))
+    return regressions
+
+# %% Run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    add_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write the timings to this baseline file')
+    parser.add_argument('--compare', help='compare the timings with this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction slower than the baseline that is allowed')
+    args = parser.parse_args()
+    options = project_options(args)
+
+    src_dir = tempfile.mkdtemp(prefix='sdg_bench_')
+    try:
+        ids = make_project(src_dir, **options)
+        timings = run_benchmarks(src_dir, ids, repeat=args.repeat)
+    finally:
+        shutil.rmtree(src_dir)
+
+    regressions = list()
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        if baseline['options'] != options:
+            print('Warning: the baseline was made with different options: ' +
+                  json.dumps(baseline['options'], sort_keys=True))
+        regressions = compare(baseline['timings'], timings, tolerance=args.tolerance)
+    else:
+        for name, seconds in timings.items():
+            print('%-16s %12.4f' % (name, seconds))
+
+    if args.save:
+        save_baseline(args.save, options, timings)
+
+    if regressions:
+        print('Slower than the baseline: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
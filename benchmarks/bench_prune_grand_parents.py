@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark sdg.edges.prune_grand_parents against the implementation it
+replaced, on synthetic wide hierarchies.
+
+Each synthetic indicator has `width` independent chains of disaggregation
+columns, each `depth` columns deep. Every column is a parent of everything
+below it in its chain, as detect_all_edges would report, so all but the
+direct parent-child edges should be pruned.
+
+With the sdg package installed, run from the repository root:
+
+    python benchmarks/bench_prune_grand_parents.py
+"""
+
+import argparse
+import timeit
+import pandas as pd
+from sdg.edges import prune_grand_parents
+
+# %% The implementation before the graph based one, kept for comparison
+
+
+def legacy_prune_grand_parents(edges):
+    for group in edges['To'].unique():
+        parents0 = list(edges['From'][edges['To'] == group])
+        grand_parents = list()
+        while len(parents0) > 0:
+            for p in parents0:
+                parents = list(edges['From'][edges['To'] == p])
+                if len(parents) > 0:
+                    grand_parents = grand_parents + parents
+                parents0 = parents
+        keep = ~(edges['From'].isin(grand_parents) & (edges['To'] == group))
+        edges = edges[keep]
+    return edges
+
+# %% Synthetic edges
+
+
+def hierarchy_edges(width, depth):
+    """Transitively closed edges for width chains of depth columns"""
+    rows = []
+    for w in range(width):
+        chain = ['col_%d_%d' % (w, d) for d in range(depth)]
+        for i in range(depth):
+            for j in range(i + 1, depth):
+                rows.append((chain[i], chain[j]))
+    return pd.DataFrame(rows, columns=['From', 'To'])
+
+# %% Run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('%6s %6s %6s %12s %12s %8s' %
+          ('width', 'depth', 'edges', 'legacy (s)', 'graph (s)', 'speedup'))
+    for width, depth in [(2, 3), (5, 4), (10, 5), (20, 6), (40, 8)]:
+        edges = hierarchy_edges(width, depth)
+
+        expected = legacy_prune_grand_parents(edges)
+        actual = prune_grand_parents(edges)
+        assert expected.equals(actual), 'Results differ'
+        assert len(actual) == width * (depth - 1)
+
+        legacy = min(timeit.repeat(lambda: legacy_prune_grand_parents(edges),
+                                   number=1, repeat=args.repeat))
+        graph = min(timeit.repeat(lambda: prune_grand_parents(edges),
+                                  number=1, repeat=args.repeat))
+        print('%6d %6d %6d %12.4f %12.4f %7.0fx' %
+              (width, depth, len(edges), legacy, graph, legacy / graph))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the libyaml loader against PyYAML's pure Python one on metadata
+
+Synthetic metadata files like those of a real project (benchmarks/
+synthetic.py) are written for a number of indicators and their
+translations, and each of the ways the package reads YAML is timed with
+both loaders, taking the best of a few runs:
+
+    front_matter      the metadata checks, the front matter of every file
+    read_meta_md      the build, front matter and content of every file
+    schema            the _prose.yml of the tests
+
+With the sdg package installed, run from the repository root:
+
+    python benchmarks/bench_yaml.py
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+import yaml
+import sdg
+from synthetic import make_project
+
+# %% Timings
+
+
+def best_time(func, repeat=3):
+    """The fastest of repeat calls, in seconds"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def with_loader(loader, func):
+    """func, run with sdg.yaml using loader"""
+    def run():
+        saved = sdg.yaml.SafeLoader
+        sdg.yaml.SafeLoader = loader
+        try:
+            func()
+        finally:
+            sdg.yaml.SafeLoader = saved
+    return run
+
+
+def run_benchmarks(src_dir, ids, prose_dir, repeat=3):
+    """Time each way of reading YAML with both loaders
+
+    Returns:
+        dict of name to (pure Python seconds, libyaml seconds)
+    """
+    index = sdg.path.scan_project(src_dir=src_dir)
+    mets = [index.meta_path(inid) for inid in ids]
+    mets = mets + [pth for inid in ids for language, pth in index.translation_paths(inid)]
+
+    def front_matter():
+        for met in mets:
+            sdg.check_metadata.read_front_matter(met)
+
+    def read_meta_md():
+        for inid in ids:
+            sdg.meta.read_meta_md(inid, src_dir=src_dir, index=index)
+
+    def schema():
+        sdg.schema.get_schema(src_dir=prose_dir)
+
+    timings = dict()
+    for name, func in [('front_matter', front_matter), ('read_meta_md', read_meta_md),
+                       ('schema', schema)]:
+        timings[name] = (best_time(with_loader(yaml.SafeLoader, func), repeat),
+                         best_time(with_loader(sdg.yaml.SafeLoader, func), repeat))
+    return timings
+
+# %% Run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--indicators', type=int, default=200)
+    parser.add_argument('--languages', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if not sdg.yaml.LIBYAML:
+        print('PyYAML was built without libyaml, so both loaders are the same')
+
+    prose_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'tests')
+    src_dir = tempfile.mkdtemp(prefix='sdg_bench_')
+    try:
+        ids = make_project(src_dir, indicators=args.indicators, rows=10,
+                           languages=args.languages)
+        timings = run_benchmarks(src_dir, ids, prose_dir, repeat=args.repeat)
+    finally:
+        shutil.rmtree(src_dir)
+
+    print('%-16s %12s %12s %8s' % ('', 'python (s)', 'libyaml (s)', 'speedup'))
+    for name, (python, libyaml) in timings.items():
+        print('%-16s %12.4f %12.4f %7.1fx' % (name, python, libyaml, python / libyaml))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Generate a synthetic SDG project of any size for benchmarking
+
+The project has the same layout as a real one: data/indicator_*.csv,
+meta/*.md with translations in meta/<language>/ and a _prose.yml. Each
+indicator's disaggregation columns form chains `depth` columns deep, like
+Region > Local authority, where a column only has a value when the column
+above it does. That is what sdg.edges has to discover. Values are left
+empty with probability `nan_density`.
+
+The same arguments and seed always give the same files. To write a project
+to look at:
+
+    python benchmarks/synthetic.py --indicators 200 --rows 5000 out_dir
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 2000
+
+PROSE = """prose:
+  metadata:
+    meta:
+      - name: "title"
+        field:
+            element: text
+            label: "Page Title"
+      - name: "reporting_status"
+        field:
+            element: select
+            label: "Reporting status"
+            options:
+              - name: "Not started"
+                value: "notstarted"
+              - name: "In progress"
+                value: "inprogress"
+              - name: "Complete"
+                value: "complete"
+      - name: "graph_type"
+        field:
+            element: select
+            label: "Graph type"
+            options:
+              - name: "Line"
+                value: "line"
+              - name: "Bar"
+                value: "bar"
+"""
+
+# %% Ids
+
+
+def indicator_ids(n):
+    """n indicator ids spread over the 17 goals, e.g. '3-2-1'"""
+    ids = list()
+    for i in range(n):
+        goal = i % 17 + 1
+        rest = i // 17
+        ids.append('%d-%d-%d' % (goal, rest // 5 + 1, rest % 5 + 1))
+    return ids
+
+# %% Data
+
+
+def column_chains(columns, depth):
+    """Names of the disaggregation columns, as chains of up to depth columns
+
+    Returns:
+        list of lists, each chain from the top column down
+    """
+    chains = list()
+    for first in range(0, columns, depth):
+        levels = min(depth, columns - first)
+        chains.append(['Dimension %d level %d' % (first // depth + 1, level + 1)
+                       for level in range(levels)])
+    return chains
+
+
+def synthetic_data(rows=1000, columns=4, depth=2, nan_density=0.1, categories=5,
+                   years=10, rng=None):
+    """A data frame like an indicator csv
+
+    Args:
+        rows: int. Number of rows
+        columns: int. Number of disaggregation columns
+        depth: int. Number of columns in each chain
+        nan_density: float. Fraction of values that are empty
+        categories: int. Number of different values in each column
+        years: int. Number of years
+        rng: numpy RandomState
+
+    Returns:
+        DataFrame with Year, the disaggregations and Value
+    """
+    if rng is None:
+        rng = np.random.RandomState(0)
+
+    df = pd.DataFrame({'Year': FIRST_YEAR + rng.randint(0, years, size=rows)})
+    # One row a year is the headline, with no disaggregation
+    headline = np.arange(rows) < years
+    df.loc[headline, 'Year'] = FIRST_YEAR + np.arange(min(rows, years))
+
+    for c, chain in enumerate(column_chains(columns, depth)):
+        # How far down the chain each row goes. 0 is the total.
+        level = rng.randint(0, len(chain) + 1, size=rows)
+        level[headline] = 0
+        for i, col in enumerate(chain):
+            labels = np.array(['D%d.%d category %d' % (c + 1, i + 1, k + 1)
+                               for k in range(categories)], dtype=object)
+            values = labels[rng.randint(0, categories, size=rows)]
+            values[level <= i] = np.nan
+            df[col] = values
+
+    value = np.round(rng.uniform(0, 100, size=rows), 2)
+    value[rng.uniform(size=rows) < nan_density] = np.nan
+    df['Value'] = value
+
+    return df
+
+# %% Metadata
+
+
+def synthetic_meta(inid, title, content_lines=10, extra_fields=40):
+    """The text of an indicator's metadata file"""
+    lines = ['---',
+             'indicator: ' + inid.replace('-', '.'),
+             'layout: indicator',
+             'permalink: /' + inid + '/',
+             "sdg_goal: '" + inid.split('-')[0] + "'",
+             'title: >-',
+             '  ' + title,
+             'reporting_status: complete',
+             'published: true',
+             'data_non_statistical: false',
+             'graph_type: line',
+             'graph_title: ' + title]
+    for k in range(extra_fields):
+        lines.append('field_%d: >-' % k)
+        lines.append('  Some text about field %d of indicator %s.' % (k, inid))
+    lines.append('---')
+    for k in range(content_lines):
+        lines.append('A paragraph of page content about %s, line %d.' % (inid, k))
+    return '\n'.join(lines) + '\n'
+
+# %% Project
+
+
+def make_project(src_dir, indicators=50, rows=1000, columns=4, depth=2, nan_density=0.1,
+                 languages=2, seed=0):
+    """Write a synthetic project to src_dir
+
+    Args:
+        src_dir: str. Directory to write to. It is made if need be.
+        indicators: int. Number of indicators
+        rows: int. Rows in each data file
+        columns: int. Disaggregation columns in each data file
+        depth: int. Length of the chains of columns, see synthetic_data
+        nan_density: float. Fraction of values that are empty
+        languages: int. Number of translation folders in meta
+        seed: int. Seed for the random data
+
+    Returns:
+        list: The indicator ids
+    """
+    rng = np.random.RandomState(seed)
+    data_dir = os.path.join(src_dir, 'data')
+    meta_dir = os.path.join(src_dir, 'meta')
+    language_codes = ['lang%d' % i for i in range(languages)]
+    for folder in [data_dir, meta_dir] + [os.path.join(meta_dir, l) for l in language_codes]:
+        os.makedirs(folder, exist_ok=True)
+
+    with open(os.path.join(src_dir, '_prose.yml'), 'w', encoding='utf-8') as f:
+        f.write(PROSE)
+
+    ids = indicator_ids(indicators)
+    for inid in ids:
+        df = synthetic_data(rows=rows, columns=columns, depth=depth,
+                            nan_density=nan_density, rng=rng)
+        df.to_csv(os.path.join(data_dir, 'indicator_' + inid + '.csv'), index=False)
+
+        title = 'Synthetic indicator ' + inid
+        with open(os.path.join(meta_dir, inid + '.md'), 'w', encoding='utf-8') as f:
+            f.write(synthetic_meta(inid, title))
+        for language in language_codes:
+            with open(os.path.join(meta_dir, language, inid + '.md'), 'w', encoding='utf-8') as f:
+                f.write(synthetic_meta(inid, title + ' (' + language + ')', extra_fields=10))
+
+    return ids
+
+
+def add_arguments(parser):
+    """The make_project options, for command line tools"""
+    parser.add_argument('--indicators', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=1000,
+                        help='rows per indicator')
+    parser.add_argument('--columns', type=int, default=4,
+                        help='disaggregation columns per indicator')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='columns in each hierarchy of disaggregations')
+    parser.add_argument('--nan-density', type=float, default=0.1,
+                        help='fraction of values that are empty')
+    parser.add_argument('--languages', type=int, default=2,
+                        help='number of translation folders')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def project_options(args):
+    """The make_project options from parsed arguments"""
+    return {'indicators': args.indicators, 'rows': args.rows, 'columns': args.columns,
+            'depth': args.depth, 'nan_density': args.nan_density,
+            'languages': args.languages, 'seed': args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('src_dir')
+    add_arguments(parser)
+    args = parser.parse_args()
+    ids = make_project(args.src_dir, **project_options(args))
+    print('Wrote %d indicators to %s' % (len(ids), args.src_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,18 @@ from . import json
 from . import meta
 from . import check_metadata
 from . import schema
+from . import manifest
+from . import compress
+from . import parallel
+from . import report
+from . import inputs
+from . import output
+from . import context
+from . import profile
+from . import stream
+from . import nulls
+from . import meta_cache
+from . import yaml
 from .check_metadata import check_all_meta
 from .check_csv import check_all_csv
-from .build import build_data
+from .build import build_data, check_and_build
@@ -9,75 +9,507 @@ output the main data, edges, and headline in csv and json format.
 
 """
 
+import functools
+import os
 import sdg
-from sdg.data import write_csv
-from sdg.json import write_json, df_to_list_dict
+from sdg.data import write_csv, write_parquet
+from sdg.json import write_json, write_json_string, encode_df
+from sdg.json import dumps, join_object
 
 # load each csv in and compute derivatives (edges, headline etc)
 # hold onto the derivatives
 # then write out in the different formats
 # write out the "all" files for each derivative
 
+# %% Build a single indicator
+
+
+def write_data_outputs(inid, data, json_engine='dict', parquet=False, site_dir='_site',
+                       context=None, nulls=None):
+    """Write the data, edges and headline outputs of one indicator
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        data: DataFrame. The indicator csv
+        json_engine: str. See build_indicator
+        parquet: bool. Also write data, edges and headline as parquet.
+        site_dir: str. Directory to build the site to
+        context: BuildContext. Optional, saves checking the directories exist
+        nulls: NullStructure. The missing values of data, if already found
+
+    Returns:
+        tuple: (status, headline_json)
+    """
+    status = True
+    # Where the writers write to
+    out = dict(site_dir=site_dir, context=context)
+    stage = sdg.profile.stage
+
+    # Compute derived datasets, from one scan for missing values
+    if nulls is None:
+        with stage('nulls', inid):
+            nulls = sdg.nulls.NullStructure(data)
+    with stage('edges', inid):
+        edges = sdg.edges.edge_detection(inid, data, nulls=nulls)
+    with stage('headline', inid):
+        headline = sdg.data.filter_headline(data, nulls=nulls)
+
+    # Output all the csvs
+    with stage('write_csv', inid):
+        status = status & write_csv(inid, data, ftype='data', **out)
+        status = status & write_csv(inid, edges, ftype='edges', **out)
+        status = status & write_csv(inid, headline, ftype='headline', **out)
+    if parquet:
+        with stage('write_parquet', inid):
+            status = status & write_parquet(inid, data, ftype='data', **out)
+            status = status & write_parquet(inid, edges, ftype='edges', **out)
+            status = status & write_parquet(inid, headline, ftype='headline', **out)
+    # And JSON. Each piece is encoded once and reused for the combined and
+    # "all" outputs.
+    with stage('encode_json', inid):
+        data_json = encode_df(data, orient='list', engine=json_engine)
+        edges_json = encode_df(edges, orient='list', engine=json_engine)
+        headline_json = encode_df(headline, orient='records', engine=json_engine)
+
+    with stage('write_json', inid):
+        status = status & write_json_string(inid, data_json, ftype='data', gz=False, **out)
+        status = status & write_json_string(inid, edges_json, ftype='edges', gz=False, **out)
+        status = status & write_json_string(inid, headline_json, ftype='headline', gz=False, **out)
+
+        # combined
+        comb_json = join_object([('data', data_json), ('edges', edges_json)])
+        status = status & write_json_string(inid, comb_json, ftype='comb', gz=False, **out)
+
+    return status, headline_json
+
+
+def build_indicator(inid, src_dir='', site_dir='_site', git=True, git_data_dir=None,
+                    git_index=None, json_engine='dict', inputs=None, typed=False,
+                    csv_engine=None, parquet=False, context=None, chunksize=None,
+                    meta_cache=None):
+    """Read the input files for one indicator and write out all of its outputs.
+
+    This is the unit of work for build_data and is safe to run in a separate
+    process, which is how the parallel build works.
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        src_dir: str. Directory root for the project where data and meta data
+            folders are
+        site_dir: str. Directory to build the site to
+        git: bool. Do you want to check git for last updated dates?
+        git_data_dir: str. Alternate folder with versioned data files.
+        git_index: dict. Last commits from sdg.git.get_git_index. If None
+            git is asked about each file.
+        json_engine: str. 'dict' to convert the data frames to python dicts
+            before encoding, 'columnar' to encode them straight from the
+            columns with sdg.json.df_to_json. The output is the same.
+        inputs: IndicatorInputs. The input files already read by
+            sdg.inputs.read_inputs. If None they are read here.
+        typed: bool. Read the disaggregation columns as categories, see
+            sdg.data.read_data. The output is the same.
+        csv_engine: str. The pandas csv parser, e.g. 'c' or 'pyarrow'.
+        parquet: bool. Also write data, edges and headline as parquet.
+        context: BuildContext. The input files and output directories
+            worked out once for the whole build. If None they are looked up.
+        chunksize: int. If the csv has more rows than this it is read and
+            written this many rows at a time, see sdg.stream. typed and
+            csv_engine don't apply to it. Not used if inputs are given.
+        meta_cache: MetaCache. Metadata files parsed by earlier builds, see
+            sdg.meta_cache. Not used if inputs are given.
+
+    Returns:
+        tuple: (status, meta_json, headline_json) where meta_json and
+        headline_json are the encoded pieces needed for the "all" outputs.
+    """
+    # Where the writers write to
+    out = dict(site_dir=site_dir, context=context)
+    index = None if context is None else context.index
+    # Stages are only timed if profiling is on
+    stage = sdg.profile.stage
+
+    # Very big csvs are streamed rather than loaded
+    chunked = False
+    if inputs is None and chunksize is not None:
+        data_path = sdg.path.input_path(inid, ftype='data', src_dir=src_dir, must_work=True)
+        chunked = not sdg.stream.fits_in_chunk(data_path, chunksize)
+
+    if chunked:
+        with stage('stream_data', inid):
+            status, headline_json = sdg.stream.write_data_chunked(
+                inid, data_path, chunksize, json_engine=json_engine, parquet=parquet, **out)
+    else:
+        # Load the raw
+        nulls = None
+        if inputs is None:
+            with stage('read_csv', inid):
+                data = sdg.data.get_inid_data(inid, src_dir=src_dir, typed=typed,
+                                              engine=csv_engine)
+        else:
+            data, nulls = inputs.data, inputs.nulls
+        status, headline_json = write_data_outputs(inid, data, json_engine=json_engine,
+                                                   parquet=parquet, nulls=nulls, **out)
+
+    # Metadata
+    with stage('read_meta', inid):
+        if inputs is None:
+            meta = sdg.meta.read_meta(inid, git=git, src_dir=src_dir, git_data_dir=git_data_dir,
+                                      git_index=git_index, index=index, meta_cache=meta_cache)
+        else:
+            meta = sdg.meta.read_meta(inid, git=git, src_dir=src_dir, git_data_dir=git_data_dir,
+                                      git_index=git_index, meta_md=inputs.meta_md,
+                                      translations=inputs.translations)
+    try:
+        meta_json = dumps(meta)
+    except Exception as e:
+        print(inid, e)
+        return False, 'null', headline_json
+    with stage('write_json', inid):
+        status = status & write_json_string(inid, meta_json, ftype='meta', **out)
+
+    return status, meta_json, headline_json
+
+
+def check_build_indicator(inid, src_dir='', **kwargs):
+    """Read the input files of one indicator once, check them and build it
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        src_dir: str. Project root directory
+        kwargs: Passed on to build_indicator
+
+    Returns:
+        tuple: (checked, built). checked is a list of (file, results) pairs
+        from sdg.inputs.check_inputs, built is what build_indicator returns.
+        A csv that can't be read is only reported, not built.
+    """
+    context = kwargs.get('context')
+    index = None if context is None else context.index
+    with sdg.profile.stage('read_inputs', inid):
+        inputs = sdg.inputs.read_inputs(inid, src_dir=src_dir, index=index,
+                                        typed=kwargs.get('typed', False),
+                                        engine=kwargs.get('csv_engine'),
+                                        meta_cache=kwargs.get('meta_cache'))
+    with sdg.profile.stage('check', inid):
+        checked = sdg.inputs.check_inputs(inputs)
+    if inputs.data is None:
+        return checked, (False, 'null', '[]')
+    return checked, build_indicator(inid, src_dir=src_dir, inputs=inputs, **kwargs)
+
+
+def indicator_outputs(inid, site_dir='_site', parquet=False):
+    """List the paths of every file build_indicator writes for inid"""
+    csvs = [sdg.path.output_path(inid, ftype=ftype, format='csv', site_dir=site_dir)
+            for ftype in ['data', 'edges', 'headline']]
+    jsons = [sdg.path.output_path(inid, ftype=ftype, format='json', site_dir=site_dir)
+             for ftype in ['data', 'edges', 'headline', 'comb', 'meta']]
+    parquets = list()
+    if parquet:
+        parquets = [sdg.path.output_path(inid, ftype=ftype, format='parquet', site_dir=site_dir)
+                    for ftype in ['data', 'edges', 'headline']]
+    return csvs + jsons + parquets
+
+
+def load_indicator(inid, site_dir='_site'):
+    """Read back the pieces of a previous build of inid that are needed for
+    the "all" outputs. Returns the same tuple as build_indicator."""
+    def read(ftype):
+        pth = sdg.path.output_path(inid, ftype=ftype, format='json', site_dir=site_dir)
+        with open(pth, encoding='utf-8') as f:
+            return f.read()
+
+    return True, read('meta'), read('headline')
+
+
 # %% Read each csv and dump out to json and csv
 
-def build_data(src_dir='', site_dir='_site', git=True, git_data_dir=None):
+def build_data(src_dir='', site_dir='_site', git=True, git_data_dir=None,
+               workers=1, pool='process', incremental=False, git_cache=None,
+               json_engine='dict', compress=None, compress_level=9,
+               check=False, report=None, report_format=None, typed=False,
+               csv_engine=None, parquet=False, chunksize=None, meta_cache=None,
+               profile=None):
     """Read each input file and edge file and write out json.
-    
+
     Args:
         src_dir: str. Directory root for the project where data and meta data
             folders are
         site_dir: str. Directory to build the site to
         git: bool. Do you want to check git for last updated dates?
-        git_data_dir: str. Alternate folder with versioned data files."""
+        git_data_dir: str. Alternate folder with versioned data files.
+        workers: int. Number of indicators to build in parallel. 1 builds
+            them one at a time in this process, None uses every core.
+        pool: str. 'process' or 'thread'. The kind of pool used when
+            workers is not 1.
+        incremental: bool. Keep a manifest of input file hashes in site_dir
+            and skip indicators whose inputs have not changed since the last
+            build. With git, indicators whose files have new commits are
+            rebuilt too. The "all" outputs are still rewritten.
+        git_cache: str. Path to a file to keep git last update information
+            in between builds. Only commits since the last build are read.
+            Keep it outside site_dir if the site is deployed.
+        json_engine: str. 'dict' or 'columnar'. How data frames are turned
+            into JSON, see build_indicator. 'columnar' is faster.
+        compress: str or list. Write precompressed copies of every csv and
+            json output alongside it. Any of 'gz' and 'br' (needs the brotli
+            package). Compression runs on a thread pool during the build.
+        compress_level: int or dict. Compression level used for every
+            format, or a dict of format to level, e.g. {'gz': 9, 'br': 11}.
+            gz takes 0 to 9 and br 0 to 11.
+        check: bool. Also run the csv and metadata checks, on the same
+            parsed files as the build so each file is only read once.
+            Problems are printed and make the status False, but the
+            outputs are still written. See check_and_build.
+        report: str. With check, a path to write a report of the check
+            results to. See sdg.report.write_report.
+        report_format: str. 'json' or 'junit'. By default this is guessed
+            from the report file extension.
+        typed: bool. Read the disaggregation columns of the csvs as pandas
+            categories. Uses much less memory on big tables. The output is
+            the same.
+        csv_engine: str. The pandas csv parser, e.g. 'c' or 'pyarrow'. None
+            is the pandas default.
+        parquet: bool. Also write data, edges and headline as parquet, and
+            an "all" parquet file of each with an indicator column. Needs
+            the pyarrow package.
+        chunksize: int. Stream any csv with more rows than this through the
+            build this many rows at a time, so that very big indicators fit
+            in memory. The output is the same, except where a column mixes
+            numbers with text, see sdg.stream. Not used with check, as the
+            checks need the whole table.
+        meta_cache: str. Path to a file to keep parsed metadata in between
+            builds. Metadata files that haven't changed aren't parsed again.
+            Keep it outside site_dir if the site is deployed. See
+            sdg.meta_cache.
+        profile: bool or str. Time each stage of the build and print a
+            summary at the end. If a path, also write a Chrome trace there
+            for chrome://tracing or Perfetto. See sdg.profile."""
+    if profile:
+        # The same build again, inside the profiler
+        options = dict(locals())
+        options['profile'] = None
+        trace = profile if isinstance(profile, str) else None
+        with sdg.profile.profiling(trace=trace):
+            return build_data(**options)
+
     status = True
 
-    ids = sdg.path.get_ids(src_dir=src_dir)
+    if pool not in sdg.parallel.POOLS:
+        raise ValueError("pool must be on of: " + ", ".join(sdg.parallel.POOLS))
+
+    expected_engines = ['dict', 'columnar']
+    if json_engine not in expected_engines:
+        raise ValueError("json_engine must be on of: " + ", ".join(expected_engines))
+
+    if parquet and sdg.data.pyarrow is None:
+        raise ImportError("The pyarrow package is needed for parquet output")
+
+    # One scan of the input folders
+    with sdg.profile.stage('scan_project'):
+        index = sdg.path.scan_project(src_dir=src_dir)
+    ids = index.ids
     if len(ids) < 1:
         raise IOError('No ids found in src_dir: ' + src_dir)
-        
+
     print("Processing data for " + str(len(ids)) + " indicators...")
+    counts_before = sdg.output.get_counts()
+
+    compressor = None
+    if compress:
+        compressor = sdg.compress.Compressor(formats=compress, level=compress_level)
+
+    # Make the output directories once, up front
+    context = sdg.context.BuildContext(src_dir=src_dir, site_dir=site_dir, index=index)
+    context.make_output_dirs(['data', 'edges', 'headline'], ['csv'])
+    context.make_output_dirs(['data', 'edges', 'headline', 'comb', 'meta'], ['json'])
+    if parquet:
+        context.make_output_dirs(['data', 'edges', 'headline'], ['parquet'])
+
+    # Walk the git history once up front. Each indicator only gets the
+    # entries for its own files. Incremental builds also need it to see
+    # which indicators have new commits.
+    git_index = None
+    if git:
+        with sdg.profile.stage('git_index'):
+            git_index = sdg.git.get_git_index(src_dir=src_dir, git_data_dir=git_data_dir,
+                                              cache_file=git_cache)
+
+    # Work out which indicators actually need building
+    old_manifest = None
+    to_build = ids
+    if incremental:
+        manifest = sdg.manifest.new_manifest({'git': git, 'git_data_dir': git_data_dir})
+        old_manifest = sdg.manifest.read_manifest(site_dir=site_dir)
+        if not sdg.manifest.is_compatible(old_manifest, manifest):
+            old_manifest = None
+        manifest['prose'] = sdg.manifest.file_hash(os.path.join(src_dir, '_prose.yml'))
 
-    all_meta = dict()
-    all_headline = dict()
+        hashes = {inid: sdg.manifest.indicator_entry(inid, src_dir=src_dir, index=index,
+                                                     git_index=git_index,
+                                                     git_data_dir=git_data_dir)
+                  for inid in ids}
+
+        def unchanged(inid):
+            return (old_manifest is not None and
+                    sdg.manifest.is_unchanged(old_manifest, inid, hashes[inid]) and
+                    all(os.path.exists(f) for f in indicator_outputs(inid, site_dir, parquet)))
+
+        to_build = [inid for inid in ids if not unchanged(inid)]
+        print("Skipping " + str(len(ids) - len(to_build)) + " unchanged indicators...")
 
     # Schema
-    schema = sdg.schema.get_schema(prose_file='_prose.yml', src_dir=src_dir)
-    status = status & write_json('schema', schema, ftype='meta', gz=False, site_dir=site_dir)
+    schema_path = sdg.path.output_path('schema', ftype='meta', format='json', site_dir=site_dir)
+    if (old_manifest is None or old_manifest['prose'] != manifest['prose'] or
+            not os.path.exists(schema_path)):
+        with sdg.profile.stage('schema'):
+            schema = sdg.schema.get_schema(prose_file='_prose.yml', src_dir=src_dir)
+            schema_status = write_json('schema', schema, ftype='meta', gz=False, context=context)
+        if incremental and not schema_status:
+            manifest['prose'] = None
+        status = status & schema_status
+        if compressor is not None:
+            compressor.add(schema_path)
+    elif compressor is not None:
+        compressor.add_missing(schema_path)
 
-    for inid in ids:
-        # Load the raw
-        data = sdg.data.get_inid_data(inid, src_dir=src_dir)
+    # Metadata parsed by earlier builds
+    cache = None
+    if meta_cache is not None:
+        cache = sdg.meta_cache.read_meta_cache(meta_cache, src_dir=src_dir)
 
-        # Compute derived datasets
-        edges = sdg.edges.edge_detection(inid, data)
-        headline = sdg.data.filter_headline(data)
+    # Files written, stages timed and metadata parsed in worker processes
+    # have to be sent back here
+    count_workers = pool == 'process' and workers != 1
+    profile_workers = count_workers and sdg.profile.is_active()
+    cache_workers = count_workers and cache is not None
 
-        # Output all the csvs
-        status = status & write_csv(inid, data, ftype='data', site_dir=site_dir)
-        status = status & write_csv(inid, edges, ftype='edges', site_dir=site_dir)
-        status = status & write_csv(inid, headline, ftype='headline', site_dir=site_dir)
-        # And JSON
-        data_dict = df_to_list_dict(data, orient='list')
-        edges_dict = df_to_list_dict(edges, orient='list')
-        headline_dict = df_to_list_dict(headline, orient='records')
+    jobs = list()
+    for inid in to_build:
+        if git_index is not None:
+            ind_git_index = sdg.git.subset_git_index(git_index, inid, src_dir=src_dir,
+                                                     git_data_dir=git_data_dir)
+        else:
+            ind_git_index = None
+        # Only the indicator's own files, as for the git index
+        ind_context = context.subset([inid])
+        options = dict(src_dir=src_dir, site_dir=site_dir, context=ind_context, git=git,
+                       git_data_dir=git_data_dir, git_index=ind_git_index,
+                       json_engine=json_engine, typed=typed,
+                       csv_engine=csv_engine, parquet=parquet, chunksize=chunksize)
+        build = check_build_indicator if check else build_indicator
+        if cache_workers:
+            # Each worker only gets the entries for its own files
+            paths = [index.meta_path(inid)] + [pth for language, pth in
+                                               index.translation_paths(inid)]
+            job = sdg.meta_cache.cached_job(cache, paths, sdg.profile.run_stage,
+                                            'indicator', inid, build, inid, **options)
+        else:
+            job = functools.partial(sdg.profile.run_stage, 'indicator', inid, build, inid,
+                                    meta_cache=cache, **options)
+        if profile_workers:
+            job = functools.partial(sdg.profile.run_profiled, job)
+        jobs.append(job)
 
-        status = status & write_json(inid, data_dict, ftype='data', gz=False, site_dir=site_dir)
-        status = status & write_json(inid, edges_dict, ftype='edges', gz=False, site_dir=site_dir)
-        status = status & write_json(inid, headline_dict, ftype='headline', gz=False, site_dir=site_dir)
+    # Each indicator is appended to the "all" outputs as soon as it is ready
+    all_meta = sdg.json.JSONObjectWriter('all', ftype='meta', context=context)
+    all_headline = sdg.json.JSONObjectWriter('all', ftype='headline', context=context)
 
-        # combined
-        comb = {'data': data_dict, 'edges': edges_dict}
-        status = status & write_json(inid, comb, ftype='comb', gz=False, site_dir=site_dir)
-        
-        # Metadata
-        meta = sdg.meta.read_meta(inid, git=git, src_dir=src_dir, git_data_dir=git_data_dir)
-        status = status & sdg.json.write_json(inid, meta, ftype='meta', site_dir=site_dir)
-        
-        # Append to the build-time "all" output
-        all_meta[inid] = meta
-        all_headline[inid] = headline_dict
-
-    status = status & sdg.json.write_json('all', all_meta, ftype='meta', site_dir=site_dir)
-    status = status & sdg.json.write_json('all', all_headline, ftype='headline', site_dir=site_dir)
+    rebuilt = set(to_build)
+    checked_files = list()
+    try:
+        with sdg.parallel.pool_map(sdg.output.run_counted, jobs,
+                                   workers=workers, pool=pool) as results:
+            for inid in ids:
+                if inid in rebuilt:
+                    built, job_counts = next(results)
+                    if count_workers:
+                        sdg.output.add_counts(job_counts)
+                    if profile_workers:
+                        built, events = built
+                        sdg.profile.add_events(events)
+                    if cache_workers:
+                        built, entries = built
+                        cache.update(entries)
+                if inid in rebuilt and check:
+                    checked, (ind_status, meta, headline) = built
+                    # Messages are printed here, in id order, not by the workers
+                    for f, check_results in checked:
+                        ind_status = ind_status & sdg.report.print_results(check_results)
+                    checked_files = checked_files + checked
+                elif inid in rebuilt:
+                    ind_status, meta, headline = built
+                else:
+                    with sdg.profile.stage('load_indicator', inid):
+                        ind_status, meta, headline = load_indicator(inid, site_dir=site_dir)
+                status = status & ind_status
+                # Only remember indicators that built cleanly so that failures
+                # are retried next time
+                if incremental and ind_status:
+                    manifest['indicators'][inid] = hashes[inid]
+                # Append to the build-time "all" output
+                all_meta.add(inid, meta)
+                all_headline.add(inid, headline)
+
+                if compressor is not None:
+                    for pth in indicator_outputs(inid, site_dir=site_dir):
+                        if inid in rebuilt:
+                            compressor.add(pth)
+                        else:
+                            compressor.add_missing(pth)
+    except BaseException:
+        all_meta.abort()
+        all_headline.abort()
+        raise
+
+    with sdg.profile.stage('write_all'):
+        status = status & all_meta.close()
+        status = status & all_headline.close()
+
+        if parquet:
+            for ftype in ['data', 'edges', 'headline']:
+                status = status & sdg.data.write_parquet_all(ids, ftype=ftype, context=context)
+
+    if compressor is not None:
+        compressor.add(all_meta.json_path)
+        compressor.add(all_headline.json_path)
+        with sdg.profile.stage('compress_wait'):
+            status = status & compressor.close()
+
+    if incremental:
+        status = status & sdg.manifest.write_manifest(manifest, site_dir=site_dir)
+
+    if cache is not None:
+        status = status & sdg.meta_cache.write_meta_cache(cache, meta_cache)
+
+    if check and report is not None:
+        status = status & sdg.report.write_report(report, 'check', checked_files,
+                                                  format=report_format)
+
+    counts = sdg.output.get_counts()
+    print("Wrote " + str(counts['written'] - counts_before['written']) + " files, skipped " +
+          str(counts['skipped'] - counts_before['skipped']) + " unchanged files")
 
     return(status)
+
+
+def check_and_build(src_dir='', site_dir='_site', report=None, report_format=None, **kwargs):
+    """Check and build every indicator, reading each input file once
+
+    The same as check_all_csv, check_all_meta and then build_data, except
+    that the checks and the build share the parsed files, and that the
+    outputs are written even if the checks fail.
+
+    Args:
+        src_dir: str. Directory root for the project where data and meta data
+            folders are
+        site_dir: str. Directory to build the site to
+        report: str. Optional path to write a report of the check results to
+        report_format: str. 'json' or 'junit'. By default this is guessed
+            from the report file extension.
+        kwargs: Any other options of build_data
+
+    Returns:
+        bool: Status. False if any check or any part of the build failed.
+    """
+    return build_data(src_dir=src_dir, site_dir=site_dir, check=True,
+                      report=report, report_format=report_format, **kwargs)
@@ -9,7 +9,10 @@ Created on 2017-10-04
 
 import pandas as pd
 import numpy as np
-from sdg.path import input_path, get_ids
+from sdg.path import scan_project
+from sdg.report import CheckResult, result, print_results, write_report
+from sdg.parallel import pool_map
+from sdg.nulls import NullStructure
 
 # %% Utility
 
@@ -23,6 +26,8 @@ def is_numeric(col):
 def is_string(col):
     """Guess whether a column is a string"""
     dt = col.dtype
+    if isinstance(dt, pd.CategoricalDtype):
+        return is_string(pd.Series(dt.categories))
     return dt == np.dtype('str') or dt == np.dtype('O')
 
 # %% Checking a single item
@@ -30,96 +35,214 @@ def is_string(col):
 
 def check_csv(csv):
     """Check an individual csv files and return logical status"""
-    status = True
+    return print_results(validate_csv(csv))
 
-    try:
-        df = pd.read_csv(csv)
-    except Exception as e:
-        print(csv, e)
-        return False
 
-    # Run through the check functions
-    status = status & check_headers(df, csv)
-    status = status & check_data_types(df, csv)
-    status = status & check_trailing_whitespace(df, csv)
-    status = status & check_leading_whitespace(df, csv)
-    status = status & check_empty_rows(df, csv)
+def validate_csv(csv, df=None, nulls=None):
+    """Read a csv, if df isn't given, and run every check on it
 
-    return status
+    Args:
+        csv: str. Path to the csv. Also used in the messages.
+        df: DataFrame. The csv already read in.
+        nulls: NullStructure. The missing values of df, if already found
+
+    Returns:
+        list of CheckResult, empty if the csv is fine
+    """
+    if df is None:
+        try:
+            df = pd.read_csv(csv)
+        except Exception as e:
+            return [result(csv, 'read', e)]
+
+    return validate(df, csv, nulls=nulls)
+
+
+def validate(df, csv, nulls=None):
+    """Run every check on a data frame
+
+    Columns are only scanned once. The header and data type checks look at
+    the column names and types. Each distinct string value is put through
+    every check in COLUMN_CHECKS. The empty row check comes from the
+    NullStructure of missing values.
+
+    Args:
+        df: DataFrame. The indicator data
+        csv: str. Name of the file for the messages
+        nulls: NullStructure. The missing values of df, if already found
+
+    Returns:
+        list of CheckResult in the order: headers, data types, column checks
+        (all columns for each check in turn), empty rows.
+    """
+    results = header_results(df, csv) + data_type_results(df, csv)
+
+    if nulls is None:
+        nulls = NullStructure(df)
+    by_check = [[] for _ in COLUMN_CHECKS]
+
+    for i, column in enumerate(df.columns):
+        col = df.iloc[:, i]
+        if is_string(col):
+            try:
+                found = run_column_checks(col, nulls.present(i))
+            except AttributeError as e:
+                # The checks have always stopped here, after the first
+                # check of the columns before
+                return results + by_check[0] + [result(csv, 'string_column', e, column=column)]
+            add_column_results(by_check, found, COLUMN_CHECKS, csv, column)
+
+    for check_results in by_check:
+        results = results + check_results
+
+    empty_rows = np.flatnonzero(~nulls.any_present())
+    if empty_rows.size > 0:
+        results.append(result(csv, 'empty_rows', ': Empty row on rows: ', empty_rows,
+                              rows=empty_rows))
+    return results
 
 
 # %% Check correct columns
 
 
-def check_headers(df, csv):
-    status = True
+def header_results(df, csv):
+    results = []
     cols = df.columns
 
     if cols[0] != 'Year':
-        status = False
-        print(csv, ': First column not called "Year"')
+        results.append(result(csv, 'headers', ': First column not called "Year"'))
     if cols[-1] != 'Value':
-        status = False
-        print(csv, ': Last column not called "Value", instead got ', cols[-1])
+        results.append(result(csv, 'headers', ': Last column not called "Value", instead got ',
+                              cols[-1]))
     # Check for whitespace in column names
     # series conversion seems necessary in pandas 0.13
     scol = pd.Series(df.columns)
     ends_white = scol.str.endswith(' ')
     if ends_white.any():
-        status = False
-        print(csv, ': Column names have trailing whitespace',
-              str(df.columns[ends_white]))
+        results.append(result(csv, 'headers', ': Column names have trailing whitespace',
+                              str(df.columns[ends_white])))
     starts_white = scol.str.startswith(' ')
     if starts_white.any():
-        status = False
-        print(csv, ': Column names have leading whitespace',
-              str(df.columns[starts_white]))
+        results.append(result(csv, 'headers', ': Column names have leading whitespace',
+                              str(df.columns[starts_white])))
 
-    return status
+    return results
+
+
+def check_headers(df, csv):
+    return print_results(header_results(df, csv))
 
 # %% Check data types
 
 
-def check_data_types(df, csv):
+def data_type_results(df, csv):
     """Year and Value must be numeric"""
-    status = True
     try:
         if not is_numeric(df['Value']):
-            status = False
-            print(csv, ': Value column must be a numeric data type')
+            return [result(csv, 'data_types', ': Value column must be a numeric data type',
+                           column='Value')]
     except Exception as e:
-        print(e)
-        return False
+        # Printed without the file name, as it always has been
+        return [CheckResult(csv, 'data_types', 'Value', None, str(e))]
+
+    return []
 
-    return status
 
-# %% Check for trailing whitespace in character columns
+def check_data_types(df, csv):
+    """Year and Value must be numeric"""
+    return print_results(data_type_results(df, csv))
+
+# %% Checks on the values in string columns
+
+
+def trailing_whitespace(values):
+    """Which values have trailing whitespace"""
+    return values.str.endswith(' ')
+
+
+def leading_whitespace(values):
+    """Which values have leading whitespace"""
+    return values.str.startswith(' ')
+
+
+# Each check is (name, function, message). The function is given a Series
+# of the distinct string values in a column and returns a boolean Series of
+# the values that fail.
+COLUMN_CHECKS = [
+    ('trailing_whitespace', trailing_whitespace, ': Trailing whitespace in column: '),
+    ('leading_whitespace', leading_whitespace, ': Leading whitespace in column: '),
+]
+
+
+def run_column_checks(col, notnull, checks=None):
+    """Put the distinct values of a string column through each check
+
+    Args:
+        col: Series. A string column
+        notnull: numpy array. Where col has values
+        checks: list. Defaults to COLUMN_CHECKS
+
+    Returns:
+        A list with an item per check. None if it passed, otherwise the
+        positions of the rows that failed.
+
+    Raises:
+        AttributeError: If the column has no strings that pandas' .str can
+            be used on, e.g. booleans with blanks, as the checks always have
+    """
+    checks = COLUMN_CHECKS if checks is None else checks
+
+    codes, uniques = pd.factorize(col[notnull])
+    uniques = pd.Series(uniques, dtype=object)
+    # Mixed columns can have numbers in them, which can't fail a string check
+    is_str = np.array([isinstance(x, str) for x in uniques], dtype=bool)
+    if not is_str.any():
+        # Raises if pandas won't treat the column as strings
+        col.str
+    values = uniques[is_str]
+    positions = np.flatnonzero(notnull)
+
+    found = []
+    for name, func, message in checks:
+        failed = np.zeros(len(uniques), dtype=bool)
+        failed[is_str] = func(values).values.astype(bool)
+        found.append(positions[failed[codes]] if failed.any() else None)
+    return found
+
+
+def column_results(df, csv, checks=None):
+    """Run the column checks on every string column
+
+    Returns:
+        list of CheckResult, all the columns for each check in turn
+    """
+    checks = COLUMN_CHECKS if checks is None else checks
+    results = [[] for _ in checks]
+    for i, column in enumerate(df.columns):
+        col = df.iloc[:, i]
+        if is_string(col):
+            found = run_column_checks(col, col.notnull().values, checks)
+            add_column_results(results, found, checks, csv, column)
+    return [res for check_results in results for res in check_results]
+
+
+def add_column_results(results, found, checks, csv, column):
+    """Turn the output of run_column_checks into CheckResults, appending
+    them to the list for each check in results"""
+    for check_results, (name, func, message), rows in zip(results, checks, found):
+        if rows is not None:
+            check_results.append(result(csv, name, message, column,
+                                        column=column, rows=rows))
 
 
 def check_trailing_whitespace(df, csv):
     """Loop over string columns and check for any trailing whitespace"""
-    status = True
-    for column in df:
-        if is_string(df[column]):
-            has_trailing_ws = df[column].str.endswith(' ', na=False).any()
-            if has_trailing_ws:
-                status = False
-                print(csv, ': Trailing whitespace in column: ', column)
-    return status
-
-# %% Check for trailing whitespace in character columns
+    return print_results(column_results(df, csv, [COLUMN_CHECKS[0]]))
 
 
 def check_leading_whitespace(df, csv):
     """Loop over string columns and check for any leading whitespace"""
-    status = True
-    for column in df:
-        if is_string(df[column]):
-            has_leading_ws = df[column].str.startswith(' ', na=False).any()
-            if has_leading_ws:
-                status = False
-                print(csv, ': Leading whitespace in column: ', column)
-    return status
+    return print_results(column_results(df, csv, [COLUMN_CHECKS[1]]))
 
 # %% Check for empty rows
 
@@ -127,7 +250,7 @@ def check_leading_whitespace(df, csv):
 def check_empty_rows(df, csv):
     """Check for rows that are completely empty"""
     status = True
-    empty_rows = df.isnull().all(axis=1)
+    empty_rows = ~NullStructure(df).any_present()
     if empty_rows.any():
         status = False
         print(csv, ': Empty row on rows: ', np.where(empty_rows)[0])
@@ -135,28 +258,59 @@ def check_empty_rows(df, csv):
 
 # %% Read each csv and run the checks
 
-def check_all_csv(src_dir=''):
+
+def check_csv_file(csv):
+    """validate_csv for check_all_csv. Never raises, so one bad file can't
+    stop a parallel run.
+
+    Returns:
+        (csv, results) tuple
+    """
+    try:
+        return csv, validate_csv(csv)
+    except Exception as e:
+        return csv, [result(csv, 'error', e)]
+
+
+def check_all_csv(src_dir='', workers=1, pool='process', report=None, report_format=None):
     """Run csv checks on all indicator csvs in the data directory
     
     Args:
         src_dir: str. Base path for the project. Csv 
             files are found relative to this
+        workers: int. Number of files to check in parallel. 1 checks them
+            one at a time in this process, None uses every core.
+        pool: str. 'process' or 'thread'
+        report: str. Optional path to write a report of the results to
+        report_format: str. 'json' or 'junit'. By default this is guessed
+            from the report file extension.
     """
 
     status = True
 
-    ids = get_ids(src_dir=src_dir)
+    index = scan_project(src_dir=src_dir)
+    ids = index.ids
 
     if len(ids) == 0:
         raise FileNotFoundError("No indicator IDs found")
     
     print("Checking " + str(len(ids)) + " metadata files...")
-    
-    for inid in ids:
-        csv = input_path(inid, ftype='data', src_dir=src_dir, must_work=True)
-        try:
-            status = status & check_csv(csv)
-        except Exception as e:
-            status = False
-            print(csv, e)    
+
+    csvs = [index.data_path(inid) for inid in ids if index.has_data(inid)]
+    missing = {index.data_path(inid) for inid in index.missing_data()}
+
+    # Messages are printed here, in id order, not by the workers
+    files = list()
+    with pool_map(check_csv_file, csvs, workers=workers, pool=pool) as results:
+        for csv in [index.data_path(inid) for inid in ids]:
+            if csv in missing:
+                csv_results = [result(csv, 'missing', ': File not found')]
+            else:
+                csv, csv_results = next(results)
+            status = status & print_results(csv_results)
+            files.append((csv, csv_results))
+
+    if report is not None:
+        status = status & write_report(report, 'csv', files, format=report_format)
+
     return(status)
@@ -7,65 +7,88 @@ Created on Thu May  4 13:53:01 2017
 
 # %% setup
 
-import yaml
-from sdg.path import input_path, get_ids
+import functools
+from sdg.path import scan_project
+from sdg.report import CheckResult, result, print_results, write_report
+from sdg.yaml import safe_load_all
+from sdg.parallel import pool_map, run_job
+from sdg.meta_cache import read_meta_cache, write_meta_cache, cached_job
 
 # %% Checking a single item
 
 
 def check_meta(meta, fname):
     """Check an individual metadata and return logical status"""
+    return print_results(validate_meta(meta, fname))
+
+
+def validate_meta(meta, fname):
+    """Run every check on an individual metadata and return the problems
+
+    Returns:
+        list of CheckResult, empty if the metadata is fine
+    """
     
     # As the number of checks increase you may want to think of a more scalable way to do this
 
-    status = True
+    results = list()
     
-    status = status & check_required(meta, fname)
-    status = status & check_reporting_status(meta, fname)
+    results = results + required_results(meta, fname)
+    results = results + reporting_status_results(meta, fname)
 
     # Should this indicator have a chart?
     meta['check_graph'] = (
-      meta['reporting_status'] == 'complete' and
-      meta['published'] and 
-      not meta['data_non_statistical']
+      meta.get('reporting_status') == 'complete' and
+      meta.get('published') and 
+      not meta.get('data_non_statistical')
     )
 
-    status = status & check_graph(meta, fname)
+    results = results + graph_results(meta, fname)
 
-    return status
+    return results
+
+
+def meta_result(fname, check, message, field=None):
+    """A CheckResult for a metadata file. The message is used as it is."""
+    return CheckResult(fname, check, field, None, message)
 
 # %% Check required
 
 
-def check_required(meta, fname):
+def required_results(meta, fname):
 
     required = ['reporting_status', 'published']
 
-    status = True
+    results = list()
 
     for req in required:
           if(req not in meta):
-              print(req + " missing in " + fname)
-              status = False
+              results.append(meta_result(fname, 'required', req + " missing in " + fname, req))
 
-    if (meta['reporting_status'] == 'complete'):
+    if (meta.get('reporting_status') == 'complete'):
         if('data_non_statistical' not in meta):
-            print("data_non_statistical" + " missing in " + fname + " for published reported indicator")
-            status = False
+            results.append(meta_result(
+                fname, 'required',
+                "data_non_statistical" + " missing in " + fname + " for published reported indicator",
+                'data_non_statistical'))
         
-    return status
+    return results
+
+
+def check_required(meta, fname):
+    return print_results(required_results(meta, fname))
 
 # %% Check for reporting status
 
 
-def check_reporting_status(meta, fname):
-    """Check an individual metadata and return logical status"""
+def reporting_status_results(meta, fname):
+    """Check an individual metadata and return the problems"""
     
-    status = True
+    results = list()
     
     if("reporting_status" not in meta):
-        print("reporting_status missing in " + fname)
-        status = False
+        results.append(meta_result(fname, 'reporting_status',
+                                   "reporting_status missing in " + fname, 'reporting_status'))
     else:
         valid_statuses = ['notstarted', 'inprogress', 'complete']
         
@@ -73,28 +96,37 @@ def check_reporting_status(meta, fname):
             err_str = "invalid reporting_status in " + fname + ": " \
                       + meta["reporting_status"] + " must be one of " \
                       + str(valid_statuses)
-            print(err_str)
-            status = False
+            results.append(meta_result(fname, 'reporting_status', err_str, 'reporting_status'))
         
-    return status
+    return results
+
+
+def check_reporting_status(meta, fname):
+    """Check an individual metadata and return logical status"""
+    return print_results(reporting_status_results(meta, fname))
 
 # %% Check graph type
 
 
-def check_graph(meta, fname):
+def graph_results(meta, fname):
     """Check that the graph_type field is valid if it is published"""
 
-    status = True
+    results = list()
 
     if(meta['check_graph']):
 
         if ('graph_title' not in meta):
-            print('graph_title missing for published statistical indicator in ' + fname)
-            status = False
+            results.append(meta_result(
+                fname, 'graph',
+                'graph_title missing for published statistical indicator in ' + fname,
+                'graph_title'))
 
         if ('graph_type' not in meta):
-            print('graph_type missing for published statistical indicator in ' + fname)
-            return False
+            results.append(meta_result(
+                fname, 'graph',
+                'graph_type missing for published statistical indicator in ' + fname,
+                'graph_type'))
+            return results
 
         valid_graph_types = ['line', 'bar', 'binary']
 
@@ -102,34 +134,101 @@ def check_graph(meta, fname):
             err_str = "invalid graph_type in " + fname + ": " \
                       + meta["graph_type"] + " must be one of " \
                       + str(valid_graph_types)
-            print(err_str)
-            status = False
+            results.append(meta_result(fname, 'graph', err_str, 'graph_type'))
         
-    return status
+    return results
+
+
+def check_graph(meta, fname):
+    """Check that the graph_type field is valid if it is published"""
+    return print_results(graph_results(meta, fname))
 
 # %% Read each yaml and run the checks
 
-def check_all_meta(src_dir=''):
+
+def read_front_matter(met):
+    """Parse the YAML front matter of a metadata file"""
+    with open(met, encoding = "UTF-8") as stream:
+        return next(safe_load_all(stream))
+
+
+def check_meta_file(met, meta_cache=None):
+    """Read a metadata file and run the checks. Never raises, so one bad
+    file can't stop a parallel run.
+
+    Args:
+        met: str. Path to the metadata file
+        meta_cache: MetaCache. If the file hasn't changed since it was
+            cached it isn't parsed again, see sdg.meta_cache.
+
+    Returns:
+        (met, results) tuple
+    """
+    try:
+        if meta_cache is None:
+            meta = read_front_matter(met)
+        else:
+            # validate_meta adds to meta, so not the cached copy
+            meta = dict(meta_cache.parse(met, read_front_matter, kind='yaml'))
+        return met, validate_meta(meta, fname = met)
+    except Exception as e:
+        return met, [result(met, 'error', e)]
+
+
+def check_all_meta(src_dir='', workers=1, pool='process', report=None, report_format=None,
+                   meta_cache=None):
     """Run metadata checks for all indicators
     
     Args:
         src_dir: str. Base path for the project. Metadata 
             files are found relative to this
+        workers: int. Number of files to check in parallel. 1 checks them
+            one at a time in this process, None uses every core.
+        pool: str. 'process' or 'thread'
+        report: str. Optional path to write a report of the results to
+        report_format: str. 'json' or 'junit'. By default this is guessed
+            from the report file extension.
+        meta_cache: str. Path to a file to keep parsed metadata in between
+            runs, see sdg.build.build_data.
     """
 
     status = True
 
-    ids = get_ids(src_dir=src_dir)
+    index = scan_project(src_dir=src_dir)
+    ids = index.ids
 
     if len(ids) == 0:
         raise FileNotFoundError("No indicator IDs found")
     
     print("Checking " + str(len(ids)) + " metadata files...")
-    
-    for inid in ids:
-        met = input_path(inid, ftype='meta', src_dir=src_dir, must_work=True)
-        with open(met, encoding = "UTF-8") as stream:
-            meta = next(yaml.safe_load_all(stream))
-        status = status & check_meta(meta, fname = met)
+
+    mets = [index.meta_path(inid) for inid in ids]
+
+    cache = None
+    if meta_cache is not None:
+        cache = read_meta_cache(meta_cache, src_dir=src_dir)
+    # Files parsed in worker processes have to be sent back here
+    cache_workers = cache is not None and pool == 'process' and workers != 1
+    if cache_workers:
+        jobs = [cached_job(cache, [met], check_meta_file, met) for met in mets]
+    else:
+        jobs = [functools.partial(check_meta_file, met, meta_cache=cache) for met in mets]
+
+    # Messages are printed here, in id order, not by the workers
+    files = list()
+    with pool_map(run_job, jobs, workers=workers, pool=pool) as results:
+        for checked in results:
+            if cache_workers:
+                checked, entries = checked
+                cache.update(entries)
+            met, met_results = checked
+            status = status & print_results(met_results)
+            files.append((met, met_results))
+
+    if cache is not None:
+        status = status & write_meta_cache(cache, meta_cache)
+
+    if report is not None:
+        status = status & write_report(report, 'meta', files, format=report_format)
     
     return(status)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Precompressed copies of the site outputs
+
+Static hosts can serve these directly, e.g. data/1-1-1.json.gz alongside
+data/1-1-1.json. The compression happens on a thread pool so that it runs
+while the rest of the build carries on.
+
+brotli is optional and only needed for the 'br' format.
+"""
+
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import brotli
+except ImportError:
+    brotli = None
+from sdg.output import write_bytes
+from sdg.profile import run_stage
+
+# %% Compress one file
+
+
+def gzip_bytes(data, level=9):
+    """gzip data with a fixed timestamp, so the same input always gives the
+    same output"""
+    buf = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=level,
+                       fileobj=buf, mtime=0) as gz:
+        gz.write(data)
+    return buf.getvalue()
+
+
+def brotli_bytes(data, level=9):
+    """brotli compress data. level is brotli's quality, 0 to 11."""
+    return brotli.compress(data, quality=level)
+
+
+COMPRESSORS = {'gz': gzip_bytes, 'br': brotli_bytes}
+
+# The levels each format accepts, lowest to highest
+LEVELS = {'gz': (0, 9), 'br': (0, 11)}
+
+
+def format_levels(formats, level=9):
+    """The compression level for each format
+
+    Args:
+        formats: list. Any of 'gz' and 'br'
+        level: int or dict. One level for every format, or a dict of format
+            to level, e.g. {'gz': 9, 'br': 11}. Formats missing from the
+            dict get 9.
+
+    Returns:
+        dict of format to level
+    """
+    levels = dict()
+    for fmt in formats:
+        fmt_level = level.get(fmt, 9) if isinstance(level, dict) else level
+        lowest, highest = LEVELS[fmt]
+        if not lowest <= fmt_level <= highest:
+            raise ValueError("compress_level for '%s' must be %d to %d, not %s" %
+                             (fmt, lowest, highest, fmt_level))
+        levels[fmt] = fmt_level
+    return levels
+
+
+def sidecar_paths(pth, formats=('gz',)):
+    """The paths of the compressed copies of pth"""
+    return [pth + '.' + fmt for fmt in formats]
+
+
+def compress_file(pth, formats=('gz',), level=9):
+    """Write compressed copies of a file next to it
+
+    Args:
+        pth: str. The file to compress
+        formats: list. Any of 'gz' and 'br'
+        level: int or dict. See format_levels
+
+    Returns:
+        bool: Status
+    """
+    levels = format_levels(formats, level)
+    try:
+        with open(pth, 'rb') as f:
+            data = f.read()
+        for fmt, out_path in zip(formats, sidecar_paths(pth, formats)):
+            write_bytes(out_path, COMPRESSORS[fmt](data, level=levels[fmt]))
+    except Exception as e:
+        print(pth, e)
+        return False
+
+    return True
+
+# %% Compress many files in the background
+
+
+class Compressor(object):
+    """Compress files on a thread pool while the build carries on
+
+    Args:
+        formats: str or list. Any of 'gz' and 'br'
+        level: int or dict. See format_levels. Levels a format doesn't
+            accept raise a ValueError here, before anything is compressed.
+        workers: int. Number of threads. None lets python decide.
+    """
+
+    def __init__(self, formats=('gz',), level=9, workers=None):
+        if isinstance(formats, str):
+            formats = [formats]
+        for fmt in formats:
+            if fmt not in COMPRESSORS:
+                raise ValueError("compress must be in: " + ", ".join(COMPRESSORS))
+        if 'br' in formats and brotli is None:
+            raise ImportError("The brotli package is needed for 'br' compression")
+
+        self.formats = list(formats)
+        self.level = format_levels(self.formats, level)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = list()
+
+    def add(self, pth):
+        """Queue a file to be compressed"""
+        self.futures.append(self.executor.submit(run_stage, 'compress', None,
+                                                 compress_file, pth,
+                                                 formats=self.formats,
+                                                 level=self.level))
+
+    def add_missing(self, pth):
+        """Queue a file only if any of its compressed copies are missing"""
+        if not all(os.path.exists(f) for f in sidecar_paths(pth, self.formats)):
+            self.add(pth)
+
+    def close(self):
+        """Wait for everything to be compressed
+
+        Returns:
+            bool: Status. False if any file failed.
+        """
+        status = all([future.result() for future in self.futures])
+        self.executor.shutdown()
+        self.futures = list()
+        return status
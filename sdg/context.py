@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Things about a build that only need working out once
+
+Without a BuildContext every writer checks for, and maybe makes, its output
+directory each time it is called, and every indicator's metadata lists the
+meta folder and looks for each translation. That is a lot of stat calls on a
+network filesystem.
+"""
+
+import os
+from sdg.path import output_path, scan_project
+
+# %% Build context
+
+
+class BuildContext(object):
+    """The input files and output directories of a build
+
+    The index of the whole project can be big, so send worker processes a
+    subset of the context with just their own indicators. Make the
+    directories with make_output_dirs before the workers start so that none
+    of them needs to check.
+
+    Args:
+        src_dir: str. Project root directory
+        site_dir: str. Directory to build the site to
+        index: ProjectIndex. The input files, from sdg.path.scan_project. If
+            None the project is scanned the first time it is needed.
+    """
+
+    def __init__(self, src_dir='', site_dir='_site', index=None):
+        self.src_dir = src_dir
+        self.site_dir = site_dir
+        self._index = index
+        self.output_dirs = dict()
+
+    @property
+    def index(self):
+        """The ProjectIndex of the input files"""
+        if self._index is None:
+            self._index = scan_project(src_dir=self.src_dir)
+        return self._index
+
+    @property
+    def languages(self):
+        """Subfolders of the meta folder, which hold the translations"""
+        return self.index.languages
+
+    def output_dir(self, ftype='data', format='json'):
+        """The directory for ftype and format outputs. It is made, if need
+        be, the first time it is asked for."""
+        key = (ftype, format)
+        if key not in self.output_dirs:
+            pth = output_path(ftype=ftype, format=format, site_dir=self.site_dir)
+            os.makedirs(pth, exist_ok=True)
+            self.output_dirs[key] = pth
+        return self.output_dirs[key]
+
+    def output_path(self, inid, ftype='data', format='json'):
+        """output_path for this site, knowing the directory exists"""
+        self.output_dir(ftype=ftype, format=format)
+        return output_path(inid, ftype=ftype, format=format, site_dir=self.site_dir)
+
+    def subset(self, ids):
+        """The same context, but only indexing these indicators"""
+        context = BuildContext(self.src_dir, self.site_dir, self.index.subset(ids))
+        context.output_dirs = self.output_dirs
+        return context
+
+    def make_output_dirs(self, ftypes, formats):
+        """Make the directories for every combination of ftypes and formats"""
+        for ftype in ftypes:
+            for format in formats:
+                self.output_dir(ftype=ftype, format=format)
+
+
+def prepare_output(inid, ftype='data', format='json', site_dir='', context=None):
+    """The path to write an output to, after making sure its directory exists
+
+    Args:
+        inid: str. The indicator identifier
+        ftype: str. See sdg.path.output_path
+        format: str. See sdg.path.output_path
+        site_dir: str. The site directory. Not used if there is a context.
+        context: BuildContext. Remembers which directories exist.
+
+    Returns:
+        str: The path
+    """
+    if context is not None:
+        return context.output_path(inid, ftype=ftype, format=format)
+
+    out_dir = output_path(ftype=ftype, format=format, site_dir=site_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+    return output_path(inid, ftype=ftype, format=format, site_dir=site_dir)
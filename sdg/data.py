@@ -4,21 +4,150 @@ Output the data in a variety of formats
 
 @author: dashton
 """
+import io
+import numpy as np
 import pandas as pd
-import os
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 from sdg.path import output_path, input_path
+from sdg.output import atomic_path
+from sdg.context import prepare_output
+from sdg.nulls import NullStructure
 
+# Columns that hold the measurements rather than a disaggregation
+VALUE_COLUMNS = ['Year', 'Value']
 
-def get_inid_data(inid, src_dir=''):
+# What read_csv reads as booleans
+BOOLEAN_VALUES = ['True', 'TRUE', 'true', 'False', 'FALSE', 'false']
+
+
+def get_inid_data(inid, src_dir='', typed=False, engine=None):
+    """Read the csv for an indicator
+
+    Args:
+        inid: str. The indicator identifier
+        src_dir: str. Project root directory
+        typed: bool. See read_data
+        engine: str. See read_data
+
+    Returns:
+        DataFrame
+    """
     pth = input_path(inid, ftype='data', src_dir=src_dir, must_work=True)
-    df = pd.read_csv(pth)
+    df = read_data(pth, typed=typed, engine=engine)
     return df
 
 
-def filter_headline(df):
+def read_data(pth, typed=False, engine=None):
+    """Read an indicator csv
+
+    Args:
+        pth: str. Path to the csv
+        typed: bool. Read the disaggregation columns as pandas categories
+            rather than python strings. This takes much less memory, and
+            time, on big tables where each value repeats many times. Year and
+            Value, and any disaggregation that turns out to be numbers or
+            booleans, get the types pandas would have given them anyway, so
+            the outputs are the same. A disaggregation mixing words with
+            numbers or booleans is read as pandas would, see mixed_category,
+            so a file with one is read without categories.
+        engine: str. The pandas csv parser, e.g. 'c' or 'pyarrow'. None is
+            the pandas default.
+
+    Returns:
+        DataFrame
+    """
+    if not typed:
+        return pd.read_csv(pth, engine=engine)
+
+    columns = pd.read_csv(pth, nrows=0).columns
+    dtype = {col: 'category' for col in columns if col not in VALUE_COLUMNS}
+    df = pd.read_csv(pth, dtype=dtype, engine=engine)
+
+    for col in dtype:
+        if col in df.columns:
+            df[col] = restore_category(df[col], engine=engine)
+            if mixed_category(df[col]):
+                return pd.read_csv(pth, engine=engine)
+
+    return df
+
+
+def mixed_category(col):
+    """Does a column of words also have numbers or booleans in it?
+
+    read_csv types the rows of a big file a block at a time, so in blocks
+    where such a column only has numbers they are read as numbers, and as
+    text in the others. Which rows those are can't be told from the
+    categories.
+
+    Args:
+        col: Series. A column from restore_category
+
+    Returns:
+        bool
+    """
+    if str(col.dtype) != 'category':
+        return False
+    values = pd.Series(col.cat.categories.astype(str))
+    numbers = pd.to_numeric(values, errors='coerce').notnull()
+    return bool((numbers | values.isin(BOOLEAN_VALUES)).any())
+
+
+def restore_category(col, engine=None):
+    """Give a category column back the type pandas would have inferred for it
+
+    Columns of words stay as categories. Numbers and booleans are parsed
+    again, but only the distinct values, to get exactly the type and values
+    read_csv would have given.
+
+    Args:
+        col: Series. A column read with dtype 'category'
+        engine: str. The csv parser it was read with
+
+    Returns:
+        Series
+    """
+    categories = col.cat.categories
+    if len(col) == 0:
+        return col.astype(object)
+    if len(categories) == 0:
+        # Nothing but missing values, which pandas reads as float
+        return pd.Series(np.nan, index=col.index, name=col.name, dtype='float64')
+
+    values = categories.astype(str)
+    # Anything needing quotes in a csv can't be a number
+    if values.str.contains('[",\n\r]').any():
+        return col
+
+    parsed = pd.read_csv(io.StringIO('\n'.join(values)), header=None,
+                         engine=engine, keep_default_na=False).iloc[:, 0]
+    if parsed.dtype == np.dtype('O') or len(parsed) != len(values):
+        return col
+
+    codes = col.cat.codes.values
+    restored = parsed.values[codes]
+    missing = codes == -1
+    if missing.any():
+        # With missing values numbers become floats and booleans objects
+        if parsed.dtype == np.dtype('bool'):
+            restored = restored.astype(object)
+        else:
+            restored = restored.astype('float64')
+        restored[missing] = np.nan
+    return pd.Series(restored, index=col.index, name=col.name)
+
+
+def filter_headline(df, nulls=None):
     """Given a dataframe filter it down to just the headline data.
 
     In the case of multiple units it will keep all headline for each unit.
+
+    Args:
+        df: DataFrame. The indicator data
+        nulls: NullStructure. The missing values of df, if already found
     """
 
     # The pandas version on trusty doesn't support 'errors' argument so:
@@ -28,15 +157,17 @@ def filter_headline(df):
         special_cols = ['Year', 'Value']
 
     # Select the non-data rows and filter rows that are all missing (nan)
-    disag = df.drop(special_cols, axis=1)
-    headline_rows = disag.isnull().all(axis=1)
+    disag = df.columns.drop(special_cols)
+    if nulls is None:
+        nulls = NullStructure(df)
+    headline_rows = ~nulls.any_present(disag)
 
     headline = df.filter(special_cols, axis=1)[headline_rows]
 
     return headline
 
 
-def write_csv(inid, df, ftype='data', site_dir=''):
+def write_csv(inid, df, ftype='data', site_dir='', context=None):
     """
     For a given ID and data set, write out as csv
 
@@ -45,25 +176,104 @@ def write_csv(inid, df, ftype='data', site_dir=''):
         df: DataFrame. The pandas data frame of the data
         ftype: Sets directory path
         site_dir: str. The site directory to build to.
+        context: BuildContext. Optional, saves checking the directory exists
 
     Returns:
         bool: Status
     """
     status = True
 
-    # If the csv dir isn't there, make it
-    csv_dir = output_path(ftype=ftype, format='csv', site_dir=site_dir)
-    if not os.path.exists(csv_dir):
-        os.makedirs(csv_dir, exist_ok=True)
+    # The path within the csv dir, which is made if it isn't there
+    out_path = prepare_output(inid, ftype=ftype, format='csv', site_dir=site_dir,
+                              context=context)
 
-    # The path within the csv dir
-    out_path = output_path(inid,  ftype=ftype, format='csv', site_dir=site_dir)
+    try:
+        with atomic_path(out_path) as tmp_path:
+            df.to_csv(tmp_path, index=False)
+    except Exception as e:
+        print(inid, e)
+        return False
+
+    return status
+
+# %% Parquet
+
+
+def parquet_frame(df):
+    """Make a data frame safe to write as parquet
+
+    A parquet column has one type, so object columns that mix strings with
+    numbers are written as strings. Missing values stay missing.
+    """
+    df = df.copy()
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if col.dtype == np.dtype('O') and \
+                pd.api.types.infer_dtype(col, skipna=True) not in ['string', 'boolean', 'empty']:
+            df.iloc[:, i] = col.where(col.isnull(), col.astype(str))
+    return df
+
+
+def write_parquet(inid, df, ftype='data', site_dir='', context=None):
+    """
+    For a given ID and data set, write out as parquet. Needs pyarrow.
+
+    Args:
+        inid: str. The indicator identifier
+        df: DataFrame. The pandas data frame of the data
+        ftype: Sets directory path
+        site_dir: str. The site directory to build to.
+        context: BuildContext. Optional, saves checking the directory exists
+
+    Returns:
+        bool: Status
+    """
+    status = True
+
+    # The path within the parquet dir, which is made if it isn't there
+    out_path = prepare_output(inid, ftype=ftype, format='parquet', site_dir=site_dir,
+                              context=context)
 
     try:
-        df.to_csv(out_path, index=False)
+        with atomic_path(out_path) as tmp_path:
+            parquet_frame(df).to_parquet(tmp_path, engine='pyarrow', index=False)
     except Exception as e:
         print(inid, e)
         return False
 
     return status
 
+
+def write_parquet_all(ids, ftype='data', site_dir='', context=None):
+    """Write one parquet file of every indicator's ftype output
+
+    The per indicator parquet files are read back and stacked, with an
+    "indicator" column first saying which indicator each row came from.
+    Columns an indicator doesn't have are missing for its rows.
+
+    Args:
+        ids: list. The indicators, whose parquet files must already exist
+        ftype: str. 'data', 'edges' or 'headline'
+        site_dir: str. The site directory to build to.
+        context: BuildContext. Optional, saves checking the directory exists
+
+    Returns:
+        bool: Status
+    """
+    if context is not None:
+        site_dir = context.site_dir
+
+    try:
+        frames = list()
+        for inid in ids:
+            df = pd.read_parquet(output_path(inid, ftype=ftype, format='parquet',
+                                             site_dir=site_dir), engine='pyarrow')
+            df.insert(0, 'indicator', inid)
+            frames.append(df)
+        df = pd.concat(frames, ignore_index=True, sort=False)
+        df['indicator'] = pd.Categorical(df['indicator'], categories=ids)
+    except Exception as e:
+        print('all', ftype, e)
+        return False
+
+    return write_parquet('all', df, ftype=ftype, site_dir=site_dir, context=context)
@@ -20,7 +20,7 @@ This is one of the more complicated scripts in the suite. It does he following\
 
 import pandas as pd
 import numpy as np
-import itertools
+from sdg.nulls import NullStructure
 
 # %% Check correct columns - copied from csvcheck
 
@@ -52,50 +52,63 @@ def x_without_y(x, y):
     return np.any(y.isnull() & x.notnull())
 
 
-def detect_all_edges(inid, df):
-    """Loop over the data frame and try all pairs"""
-    cols = df.columns
-    # Remove the protected columns
-    cols = cols[[x not in ['Year', 'Units', 'Value', 'GeoCode'] for x in cols]]
-
-    edges = pd.DataFrame(columns=['From', 'To'])
-
-    # Loop over all pairs
-    for a, b in itertools.combinations(cols, 2):
-        # itertools.combinations returns pairs of columns in the order
-        # they appear without repeating elements, so:
-        # combinations('ABCD', 2)	produces AB AC AD BC BD CD
-        # but does not produce BA, CA, etc.
-
-        # Check if a and b are ever present without each other
-        a_without_b = x_without_y(df[a], df[b])
-        b_without_a = x_without_y(df[b], df[a])
-
-        # Check if a and b are not empty.
-        a_not_empty = not df[a].dropna().empty
-        b_not_empty = not df[b].dropna().empty
-
-        # test if ab is an edge (at least one case where b has an empty
-        # elements where a does not)
-        if a_without_b and not b_without_a and b_not_empty:
-            # A is a parent of B
-            # so add to df of edges
-            edges = edges.append(pd.DataFrame({'From': [a], 'To': [b]}))
-
-        # if ab is not an edge, test whether ba is an edge
-        # (at least one case where a has empty and b doesn't)
-        elif b_without_a and not a_without_b and a_not_empty:
-            # B is a parent of A
-            # so add to df of edges
-            edges = edges.append(pd.DataFrame({'From': [b], 'To': [a]}))
-
-        # if ab not an edge and ba not an edge, then test that for every
-        # element in a there is an element in b and vice versa
-        elif not a_without_b and not b_without_a and a_not_empty and b_not_empty:
-            # co-depedent; choose A as left-most
-            edges = edges.append(pd.DataFrame({'From': [a], 'To': [b]}))
+def edges_from_presence(cols, without, not_empty):
+    """Turn the pairwise comparisons into parent-child edges
 
-    return edges
+    Args:
+        cols (Index): The candidate columns
+        without (numpy array): Output of NullStructure.present_without for cols
+        not_empty (numpy array): True for columns with any values
+    Returns:
+        DataFrame of edges with From and To columns
+    """
+    # triu_indices walks the pairs in the same order as
+    # itertools.combinations: AB AC AD BC BD CD
+    a, b = np.triu_indices(len(cols), k=1)
+
+    # Check if a and b are ever present without each other
+    a_without_b = without[a, b]
+    b_without_a = without[b, a]
+
+    # A is a parent of B: at least one case where b is empty where a is not
+    a_parent = a_without_b & ~b_without_a & not_empty[b]
+    # B is a parent of A
+    b_parent = b_without_a & ~a_without_b & not_empty[a]
+    # co-dependent; choose A as left-most
+    co_dependent = ~a_without_b & ~b_without_a & not_empty[a] & not_empty[b]
+
+    is_edge = a_parent | b_parent | co_dependent
+    parent = np.where(b_parent, b, a)[is_edge]
+    child = np.where(b_parent, a, b)[is_edge]
+
+    return pd.DataFrame({'From': cols[parent], 'To': cols[child]},
+                        columns=['From', 'To'])
+
+
+def edge_columns(cols):
+    """The columns that can be in an edge, i.e. not the protected columns"""
+    return cols[[x not in ['Year', 'Units', 'Value', 'GeoCode'] for x in cols]]
+
+
+def detect_all_edges(inid, df, nulls=None):
+    """Compare all pairs of columns in the data frame
+
+    The missing values are found once for the whole table and every pair is
+    compared in one go, see NullStructure.present_without.
+
+    Args:
+        inid (str): The indicator id
+        df (pandas DataFrame): The indicator data
+        nulls (NullStructure): The missing values of df, if already found
+    """
+    cols = edge_columns(df.columns)
+
+    if nulls is None:
+        nulls = NullStructure(df)
+    without = nulls.present_without(cols)
+    not_empty = nulls.not_empty(cols)
+
+    return edges_from_presence(cols, without, not_empty)
 
 
 # %% Remove Grand Parents
@@ -108,49 +121,67 @@ def prune_grand_parents(edges):
     will return from A to C as an edge (see 'transitive relation')
     this function removes the AC edge in those cases
 
+    This is a transitive reduction. The ancestors of each column are held as
+    a bitset (a python int with one bit per column) and built up in
+    topological order, so each edge is only visited a couple of times.
+
     Args:
         edges (DataFrame): The edges data frame
 
     Returns:
         The data frame with grand parent edges removed
-    """
-
-    # iterate over unique 'children' (those that have parents)
-    for group in edges['To'].unique():
 
-        # list all the parents of the given child
-        parents0 = list(edges['From'][edges['To'] == group])
-
-        # create an empty list to fill with grandparents
-        grand_parents = list()
-
-        # elements will be removed from parents0 inside the while loop - once
-        # they have all been removed, end loop
-        while len(parents0) > 0:
-            # go through the list of parents
-            for p in parents0:
-
-                # define parents as the list of parents of p (a known parent)
-                parents = list(edges['From'][edges['To'] == p])
-                # if len(parents) > 0, then there are parents of the parent (p)
-                if len(parents) > 0:
-                    # so add them to the list of grand_parents
-                    grand_parents = grand_parents + parents
-                # set parents0 to be the newly identified grand parents
-                parents0 = parents
-
-        # drop all edges where the 'from' is in grandparents AND where the 'to'
-        # is the child from the start of the outer for loop
-        keep = ~(edges['From'].isin(grand_parents) & (edges['To'] == group))
-
-        edges = edges[keep]
-    return edges
+    Raises:
+        ValueError: If the edges contain a cycle
+    """
+    parents = list(edges['From'])
+    children = list(edges['To'])
+
+    # Number the columns so they can be used as bit positions
+    nodes = dict()
+    for col in parents + children:
+        nodes.setdefault(col, len(nodes))
+    edge_list = [(nodes[p], nodes[c]) for p, c in zip(parents, children)]
+
+    parents_of = [[] for _ in nodes]
+    children_of = [[] for _ in nodes]
+    for p, c in edge_list:
+        parents_of[c].append(p)
+        children_of[p].append(c)
+
+    # Kahn's algorithm gives the topological order
+    n_parents = [len(ps) for ps in parents_of]
+    order = [n for n in range(len(nodes)) if n_parents[n] == 0]
+    for n in order:
+        for c in children_of[n]:
+            n_parents[c] -= 1
+            if n_parents[c] == 0:
+                order.append(c)
+
+    if len(order) < len(nodes):
+        cycle = [col for col, n in nodes.items() if n_parents[n] > 0]
+        raise ValueError('Cycle in edges between: ' + ', '.join(map(str, cycle)))
+
+    # ancestors[n] has a bit set for every column above n. grand_parents[n]
+    # has a bit set for every column that is above one of n's parents, so
+    # an edge from there to n is a shortcut.
+    ancestors = [0] * len(nodes)
+    grand_parents = [0] * len(nodes)
+    for n in order:
+        for p in parents_of[n]:
+            grand_parents[n] |= ancestors[p]
+            ancestors[n] |= ancestors[p] | (1 << p)
+
+    keep = np.array([not (grand_parents[c] >> p) & 1 for p, c in edge_list],
+                    dtype=bool)
+
+    return edges[keep]
 
 
 # %% Write out edges for one inid
 
 
-def edge_detection(inid, df):
+def edge_detection(inid, df, nulls=None):
     """Check dependencies between columns and write out the edges
 
     If there are any problems return False as this is part of the build.
@@ -158,6 +189,7 @@ def edge_detection(inid, df):
     Args:
         inid (str): The indicator id for printing
         df (pandas DataFrame): The indicator data read from raw csv
+        nulls (NullStructure): The missing values of df, if already found
 
     Returns:
         DataFrame: edge data frame
@@ -166,7 +198,7 @@ def edge_detection(inid, df):
     check_headers(inid, df)
 
     # Get the edges
-    edges = detect_all_edges(inid, df)
+    edges = detect_all_edges(inid, df, nulls=nulls)
     edges = prune_grand_parents(edges)
 
     return edges
@@ -7,26 +7,23 @@ Functions for interacting with the git repository
 
 import re
 import os
+import json
 # None-standard library
 import git
 # Local modules
 from sdg.path import input_path  # local package
 
-# %% Faster but not using right now
-# 
-# def get_last_update(obj, repo):
-#     commit = next(repo.iter_commits(paths=obj.path, max_count=1))
-#     git_date = str(commit.committed_datetime.date())
-#     return {'file': obj.path, 'sha':commit.hexsha, 'date': git_date}
-# 
-# repo = git.Repo("data", search_parent_directories=True) 
-# tree = repo.tree()
-# 
-# %time git_update = [get_last_update(obj, repo) for obj in tree['data']]
-# 
 # %% Get file updates
 
 
+def get_commit_url(repo, sha=''):
+    """Turn the remote URL into a commit URL. Without a sha this gives the
+    base that a sha can be appended to."""
+    remote = repo.remote().url
+    remote_bare = re.sub('^.*github\.com(:|\/)', '', remote).replace('.git','')
+    return 'https://github.com/'+remote_bare+'/commit/'+sha
+
+
 def get_git_update(inid, ftype, src_dir='', git_data_dir=None):
     """Change into the working directory of the file (it might be a submodule)
     and get the latest git history"""
@@ -41,10 +38,7 @@ def get_git_update(inid, ftype, src_dir='', git_data_dir=None):
     commit = next(repo.iter_commits(paths=f, max_count=1))
     git_date = str(commit.committed_datetime.date())
     git_sha = commit.hexsha
-    # Turn the remote URL into a commit URL
-    remote = repo.remote().url
-    remote_bare = re.sub('^.*github\.com(:|\/)', '', remote).replace('.git','')
-    commit_url = 'https://github.com/'+remote_bare+'/commit/'+git_sha
+    commit_url = get_commit_url(repo, git_sha)
     
     return {'date': git_date,
             'sha': git_sha,
@@ -53,21 +47,195 @@ def get_git_update(inid, ftype, src_dir='', git_data_dir=None):
             'commit_url': commit_url}
  
 
+# %% Get all file updates in one pass
+
+
+def get_repo_updates(repo, paths=None, since=None):
+    """Walk the history of a repository once and find the last commit that
+    touched every file.
+
+    Args:
+        repo: git.Repo. The repository to search
+        paths: list. Only look at files under these paths, relative to the
+            repository root. None for all files.
+        since: str. Only look at commits after this one, up to HEAD.
+
+    Returns:
+        A dict of file path (relative to the repository root, '/' separated)
+        to a dict with the 'date' and 'sha' of its last commit.
+    """
+    # -z gives unquoted, NUL separated file names. Each commit starts with
+    # \x01 so it can't be confused with a file name. --cc lists the files a
+    # merge changed from all of its parents, e.g. a conflict resolved by
+    # hand, which git log leaves out otherwise. iter_commits(paths=...)
+    # counts those merges as changing the file too.
+    revs = [since + '..HEAD'] if since else []
+    log = repo.git.log('-z', '--cc', '--name-only', '--format=%x01%H %cI',
+                       *revs, '--', *(paths or []))
+
+    updates = dict()
+    for record in log.split('\x01')[1:]:
+        header, _, names = record.partition('\0')
+        git_sha, git_date = header.split(' ')
+        for name in names.strip('\n').split('\0'):
+            # Newest first, so the first time we see a file is its last update
+            if name and name not in updates:
+                updates[name] = {'date': git_date[:10], 'sha': git_sha}
+    return updates
+
+
+def get_cached_repo_updates(repo, paths=None, cached=None):
+    """get_repo_updates, reusing the results of an earlier walk
+
+    Args:
+        repo: git.Repo. The repository to search
+        paths: list. As for get_repo_updates
+        cached: dict. The output of an earlier call, or None
+
+    Returns:
+        A dict with the 'head' sha the updates are valid for, the 'paths'
+        searched and the 'files' as returned by get_repo_updates. If HEAD
+        hasn't moved the cached files are used as they are. If it has moved
+        on from the cached HEAD only the new commits are scanned.
+    """
+    head = repo.head.commit.hexsha
+
+    if cached is not None and cached.get('paths') == paths:
+        if cached['head'] == head:
+            return cached
+        try:
+            moved_on = repo.is_ancestor(cached['head'], head)
+        except git.exc.GitCommandError:
+            # The cached HEAD isn't in this clone
+            moved_on = False
+        if moved_on:
+            files = dict(cached['files'])
+            files.update(get_repo_updates(repo, paths=paths, since=cached['head']))
+            return {'head': head, 'paths': paths, 'files': files}
+
+    return {'head': head, 'paths': paths, 'files': get_repo_updates(repo, paths=paths)}
+
+
+def read_git_cache(cache_file):
+    """Read a cache written by write_git_cache. Returns an empty cache if the
+    file is missing or can't be read."""
+    empty = {'repos': dict()}
+    if cache_file is None or not os.path.isfile(cache_file):
+        return empty
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            cache = json.load(f)
+    except ValueError as e:
+        print(cache_file, e)
+        return empty
+    return cache if 'repos' in cache else empty
+
+
+def write_git_cache(cache, cache_file):
+    """Save the git cache so the next build can pick up where this one left
+    off"""
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+
+def get_git_index(src_dir='', git_data_dir=None, cache_file=None):
+    """Find the last commit for every data and metadata file in one go.
+
+    Each repository (the data folder may be a submodule) is opened once and
+    its log walked once, rather than once per file as in get_git_update.
+
+    Args:
+        src_dir: str. Project root directory
+        git_data_dir: str. Alternate folder with versioned data files.
+        cache_file: str. Optional path to a file to keep the results in
+            between builds. Results are keyed by each repository's HEAD so
+            only new commits need to be looked at next time.
+
+    Returns:
+        A dict of absolute file path to a dict with the 'date', 'sha', 'file'
+        (relative to its repository) and 'commit_url' of its last commit.
+    """
+    folders = [input_path(None, ftype='meta', src_dir=src_dir),
+               input_path(None, ftype='data', src_dir=src_dir, git_data_dir=git_data_dir)]
+
+    # Group the folders by the repository they are in
+    repos = dict()
+    for folder in folders:
+        repo = git.Repo(folder, search_parent_directories=True)
+        repo_dir = os.path.abspath(repo.working_dir)
+        rel = os.path.relpath(os.path.abspath(folder), repo_dir)
+        repos.setdefault(repo_dir, (repo, []))[1].append(rel.replace(os.sep, '/'))
+
+    cache = read_git_cache(cache_file)
+
+    index = dict()
+    for repo_dir, (repo, paths) in repos.items():
+        # Key on the location relative to the project so that the cache
+        # still works if the project is checked out somewhere else
+        key = os.path.relpath(repo_dir, os.path.abspath(src_dir)).replace(os.sep, '/')
+        updates = get_cached_repo_updates(repo, paths=paths, cached=cache['repos'].get(key))
+        cache['repos'][key] = updates
+
+        url = get_commit_url(repo)
+        for f, update in updates['files'].items():
+            index[os.path.normpath(os.path.join(repo_dir, f))] = {
+                'date': update['date'],
+                'sha': update['sha'],
+                'file': f,
+                'commit_url': url + update['sha']}
+
+    if cache_file is not None:
+        write_git_cache(cache, cache_file)
+
+    return index
+
+
+def subset_git_index(git_index, inid, src_dir='', git_data_dir=None):
+    """Just the entries of git_index that get_git_updates needs for inid.
+    Handy to avoid sending the whole index to every parallel worker."""
+    files = [input_path(inid, ftype='meta', src_dir=src_dir),
+             input_path(inid, ftype='data', src_dir=src_dir, git_data_dir=git_data_dir)]
+    files = [os.path.abspath(f) for f in files]
+    return {f: git_index[f] for f in files if f in git_index}
+
+
+def lookup_git_update(inid, ftype, git_index, src_dir='', git_data_dir=None):
+    """Same as get_git_update but using an index from get_git_index. Files
+    missing from the index fall back to get_git_update."""
+    f = os.path.abspath(input_path(inid, ftype=ftype, src_dir=src_dir, git_data_dir=git_data_dir))
+    if f not in git_index:
+        return get_git_update(inid, ftype=ftype, src_dir=src_dir, git_data_dir=git_data_dir)
+
+    update = dict(git_index[f])
+    update['id'] = inid
+    return update
+
+
+# %% Metadata fields
 
 
-def get_git_updates(inid, src_dir='', git_data_dir=None):
+def get_git_updates(inid, src_dir='', git_data_dir=None, git_index=None):
     """
     
     Args:
         inid: str. The id of the indicator in short form. e.g. '2-1-2'.
         src_dir: str. Project root directory
         git_data_dir: str. Alternate folder with versioned data files.
+        git_index: dict. Output of get_git_index. If None then git is
+            queried for each file.
         
     Returns:
         A dict with the required metadata fields
     """
-    meta_update = get_git_update(inid=inid, ftype='meta', src_dir=src_dir)
-    data_update = get_git_update(inid=inid, ftype='data', src_dir=src_dir, git_data_dir=git_data_dir)
+    if git_index is None:
+        meta_update = get_git_update(inid=inid, ftype='meta', src_dir=src_dir)
+        data_update = get_git_update(inid=inid, ftype='data', src_dir=src_dir, git_data_dir=git_data_dir)
+    else:
+        meta_update = lookup_git_update(inid, 'meta', git_index, src_dir=src_dir)
+        data_update = lookup_git_update(inid, 'data', git_index, src_dir=src_dir, git_data_dir=git_data_dir)
     
     return {'national_data_update_url_text': data_update['date'] + ': see changes on GitHub',
             'national_data_update_url': data_update['commit_url'],
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Read the input files for an indicator once and share them
+
+check_and_build checks and builds each indicator from the same parsed csv
+and metadata, rather than the checks and the build each reading the files.
+"""
+
+from collections import namedtuple
+from sdg.path import input_path
+from sdg.data import read_data
+from sdg.nulls import NullStructure
+from sdg.meta import read_meta_md
+from sdg.check_csv import validate_csv
+from sdg.check_metadata import validate_meta
+from sdg.report import result
+
+# %% Read
+
+
+# Everything read from the input files of one indicator. data is None, and
+# data_error set, if the csv couldn't be read. nulls is the NullStructure of
+# data, shared by the checks and the build.
+IndicatorInputs = namedtuple('IndicatorInputs', ['inid', 'data_path', 'data', 'data_error',
+                                                 'meta_path', 'meta_md', 'translations',
+                                                 'nulls'])
+
+
+def read_inputs(inid, src_dir='', languages=None, typed=False, engine=None, index=None,
+                meta_cache=None):
+    """Read and parse every input file of one indicator
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        src_dir: str. Project root directory
+        languages: list. Subfolders of meta to look for translations in. If
+            None they are looked up.
+        typed: bool. See sdg.data.read_data
+        engine: str. See sdg.data.read_data
+        index: ProjectIndex. Which translations exist, see
+            sdg.meta.read_meta_md
+        meta_cache: MetaCache. Parsed metadata kept from earlier builds,
+            see sdg.meta.read_meta_md
+
+    Returns:
+        IndicatorInputs
+    """
+    # A missing csv is reported by the checks like any other that can't be read
+    data_path = input_path(inid, ftype='data', src_dir=src_dir)
+    meta_path = input_path(inid, ftype='meta', src_dir=src_dir, must_work=True)
+
+    data, data_error, nulls = None, None, None
+    try:
+        data = read_data(data_path, typed=typed, engine=engine)
+    except Exception as e:
+        data_error = e
+    else:
+        nulls = NullStructure(data)
+
+    meta_md, translations = read_meta_md(inid, src_dir=src_dir, languages=languages,
+                                         index=index, meta_cache=meta_cache)
+
+    return IndicatorInputs(inid, data_path, data, data_error,
+                           meta_path, meta_md, translations, nulls)
+
+# %% Check
+
+
+def check_inputs(inputs):
+    """Run the csv and metadata checks on inputs that have already been read
+
+    Returns:
+        list: (file, results) pairs, the csv then the metadata, as
+        check_all_csv and check_all_meta give them
+    """
+    if inputs.data is None:
+        csv_results = [result(inputs.data_path, 'read', inputs.data_error)]
+    else:
+        csv_results = validate_csv(inputs.data_path, df=inputs.data, nulls=inputs.nulls)
+
+    # validate_meta adds check_graph, which mustn't end up in the build
+    meta_results = validate_meta(dict(inputs.meta_md[0]), inputs.meta_path)
+
+    return [(inputs.data_path, csv_results), (inputs.meta_path, meta_results)]
@@ -22,9 +22,10 @@ import numpy as np
 import os.path
 import math
 import json
-import gzip
 # cd scripts, then cd .. when interactive
-from sdg.path import output_path
+from sdg.output import write_bytes, write_text, replace_file, temp_path
+from sdg.compress import gzip_bytes
+from sdg.context import prepare_output
 
 # %% NaNs to None
 
@@ -102,43 +103,234 @@ def df_to_list_dict(df, orient='records'):
     else:
         return df_nan_to_none(df, orient=orient)
 
+# %% Columnar JSON
+
+
+def dumps(obj):
+    """Encode a JSON ready dict/list as a JSON string"""
+    out_json = pd.io.json.dumps(obj)
+    return out_json.replace("\\/", "/")  # why does it double escape?
+
+
+def join_object(items):
+    """Build a JSON object out of values that are already encoded
+
+    This is how the combined and "all" outputs are put together, so that
+    the biggest objects in the build are only encoded once.
+
+    Args:
+        items --- iterable of (key, JSON string) pairs
+
+    Return:
+        JSON string. The same as encoding a dict of the decoded values.
+    """
+    return '{' + ','.join(dumps(key) + ':' + value for key, value in items) + '}'
+
+
+def encode_column(col):
+    """JSON encode every value in a column
+
+    Each distinct value is only encoded once, which is cheap as
+    disaggregation columns repeat a handful of values. Missing values become
+    null.
+
+    Args:
+        col --- pandas Series
+
+    Return:
+        numpy object array with the encoded string for each row
+    """
+    if col.dtype == np.dtype('O') and pd.api.types.infer_dtype(col, skipna=True) != 'string':
+        # Mixed python objects. 1, 1.0 and True are equal as far as
+        # factorize is concerned but not as JSON, so encode them one by one.
+        return np.array([dumps(nan_to_none(x)) for x in col], dtype=object)
+
+    codes, uniques = pd.factorize(col)
+    # tolist gives python scalars, exactly what to_dict would have given
+    uniques = uniques.tolist()
+    if pd.api.types.is_numeric_dtype(col.dtype) and len(uniques) > 0:
+        # Numbers can't contain commas so encode them all in one go
+        encoded = dumps(uniques)[1:-1].split(',')
+    else:
+        encoded = [dumps(x) for x in uniques]
+    # factorize codes missing values as -1, which picks the last element
+    encoded.append('null')
+    return np.array(encoded, dtype=object)[codes]
+
+
+def df_to_json(df, orient='records'):
+    """Convert a data frame straight to a JSON string
+
+    This gives the same string as dumps(df_to_list_dict(df, orient)) but
+    works on whole columns, so there is no dict per row or nan_to_none call
+    per cell.
+
+    Args:
+        df --- pandas DataFrame.
+        orient --- either 'records' for rowwise, or 'list' for colwise
+
+    Return:
+        JSON string of a list of objects (rowwise) or object of lists
+        (colwise). Any empty data frame gives an empty list.
+    """
+    expected_orient = ['list', 'records']
+    if orient not in expected_orient:
+        raise ValueError("orient must be on of: " + ", ".join(expected_orient))
+
+    if df.shape[0] < 1 or df.shape[1] < 1:
+        return dumps(df_to_list_dict(df, orient=orient))
+
+    keys = [dumps(col) for col in df.columns]
+    columns = [encode_column(df.iloc[:, i]) for i in range(df.shape[1])]
+
+    if orient == 'list':
+        return '{' + ','.join(key + ':[' + ','.join(values) + ']'
+                              for key, values in zip(keys, columns)) + '}'
+
+    # Build up each row's object one column at a time
+    rows = '{' + keys[0] + ':' + columns[0]
+    for key, values in zip(keys[1:], columns[1:]):
+        rows = rows + (',' + key + ':') + values
+    return '[' + '},'.join(rows) + '}]'
+
+
+def encode_df(df, orient='records', engine='dict'):
+    """Encode a data frame as JSON with either engine
+
+    Args:
+        df --- pandas DataFrame.
+        orient --- either 'records' for rowwise, or 'list' for colwise
+        engine --- 'dict' to go through df_to_list_dict, 'columnar' to use
+            df_to_json. The output is the same.
+
+    Return:
+        JSON string
+    """
+    if engine == 'columnar':
+        return df_to_json(df, orient=orient)
+    return dumps(df_to_list_dict(df, orient=orient))
+
 # %% Write one data frame to JSON
-    
 
-def write_json(inid, obj, ftype='data', gz=False, site_dir=''):
-    """Write out the supplied object as a single json file. This can
-    either be as records (orient='records') or as columns (orient='list').
+
+def write_json_string(inid, out_json, ftype='data', gz=False, site_dir='', context=None):
+    """Write out an already encoded JSON string as a single json file.
 
     Args:
         inid -- str: The indicator id, e.g. '1-1-1'
-        obj -- dict or list: A json ready dict/list
+        out_json -- str: The JSON to write
         ftype -- str: Output type. Used to find the path
         gz -- bool: if True then compress the output with gzip
+        context -- BuildContext: Optional, saves checking the directory exists
 
     Return:
         status. bool.
     """
 
     try:
-        out_json = pd.io.json.dumps(obj)
-        out_json = out_json.replace("\\/", "/")  # why does it double escape?
-        
-        json_dir = output_path(ftype=ftype, format='json', site_dir=site_dir)
-        if not os.path.exists(json_dir):
-            os.makedirs(json_dir, exist_ok=True)
-
-        json_path = output_path(inid,  ftype=ftype, format='json', site_dir=site_dir)
+        json_path = prepare_output(inid, ftype=ftype, format='json', site_dir=site_dir,
+                                   context=context)
 
-        # Write out
+        # Write out, if it has changed
         if gz:
-            json_bytes = out_json.encode('utf-8')
-            with gzip.open(json_path + '.gz', 'w') as outfile:
-                outfile.write(json_bytes)
+            write_bytes(json_path + '.gz', gzip_bytes(out_json.encode('utf-8')))
         else:
-            with open(json_path, 'w', encoding='utf-8') as outfile:
-                outfile.write(out_json)
+            write_text(json_path, out_json)
     except Exception as e:
         print(inid, e)
         return False
 
     return True
+
+
+# %% Write a JSON object a piece at a time
+
+
+class JSONObjectWriter(object):
+    """Write out a JSON object one member at a time
+
+    Used for the "all" outputs so that each indicator can be written as soon
+    as it is built, rather than holding the whole site in memory. The file is
+    written under a temporary name and only moved into place by close, so a
+    failed build leaves the previous file alone. If the content hasn't
+    changed the previous file isn't touched at all.
+
+    Use as a context manager:
+
+        with JSONObjectWriter('all', ftype='meta', site_dir=site_dir) as w:
+            w.add('1-1-1', meta_json)
+    """
+
+    def __init__(self, inid, ftype='data', site_dir='', context=None):
+        self.inid = inid
+        self.json_path = prepare_output(inid, ftype=ftype, format='json', site_dir=site_dir,
+                                        context=context)
+        self.tmp_path = temp_path(self.json_path)
+        self.outfile = open(self.tmp_path, 'w', encoding='utf-8')
+        self.outfile.write('{')
+        self.sep = ''
+
+    def add(self, key, value_json):
+        """Append a member to the object
+
+        Args:
+            key -- str: The member name
+            value_json -- str: The already encoded value
+        """
+        self.outfile.write(self.sep + dumps(key) + ':' + value_json)
+        self.sep = ','
+
+    def close(self):
+        """Finish the object and move the file into place
+
+        Return:
+            status. bool.
+        """
+        try:
+            self.outfile.write('}')
+            self.outfile.close()
+            replace_file(self.tmp_path, self.json_path)
+        except Exception as e:
+            print(self.inid, e)
+            return False
+        return True
+
+    def abort(self):
+        """Throw away what has been written so far"""
+        self.outfile.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        elif not self.outfile.closed:
+            self.close()
+
+
+def write_json(inid, obj, ftype='data', gz=False, site_dir='', context=None):
+    """Write out the supplied object as a single json file. This can
+    either be as records (orient='records') or as columns (orient='list').
+
+    Args:
+        inid -- str: The indicator id, e.g. '1-1-1'
+        obj -- dict or list: A json ready dict/list
+        ftype -- str: Output type. Used to find the path
+        gz -- bool: if True then compress the output with gzip
+        context -- BuildContext: Optional, saves checking the directory exists
+
+    Return:
+        status. bool.
+    """
+
+    try:
+        out_json = dumps(obj)
+    except Exception as e:
+        print(inid, e)
+        return False
+
+    return write_json_string(inid, out_json, ftype=ftype, gz=gz, site_dir=site_dir,
+                             context=context)
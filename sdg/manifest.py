@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+The build manifest records a hash of every input file that went into each
+indicator, and with git dates the last commit of its files, so that the
+next build can skip indicators that have not changed.
+
+The manifest lives in the site directory next to the outputs it describes.
+"""
+
+import hashlib
+import json
+import os
+import sdg
+from sdg.path import input_path
+
+MANIFEST_FILE = 'manifest.json'
+
+# %% Hashing
+
+
+def file_hash(pth):
+    """Return the sha1 hex digest of a file's contents"""
+    sha = hashlib.sha1()
+    with open(pth, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def input_hashes(inid, src_dir='', languages=None, index=None):
+    """Hash every input file for one indicator
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        src_dir: str. Project root directory
+        languages: list. Subfolders of meta to look for translations in. If
+            None they are looked up.
+        index: ProjectIndex. Which translations exist. Saves looking.
+
+    Returns:
+        dict of path (relative to src_dir) to hash. Translations that do not
+        exist are left out, so adding one changes the result.
+    """
+    files = [input_path(inid, ftype='data', src_dir=src_dir),
+             input_path(inid, ftype='meta', src_dir=src_dir)]
+    if index is not None:
+        files = files + [i18n_fr for language, i18n_fr in index.translation_paths(inid)]
+    else:
+        meta_folder = input_path(None, ftype='meta', src_dir=src_dir)
+        if languages is None:
+            languages = next(os.walk(meta_folder))[1]
+        for language in languages:
+            i18n_fr = os.path.join(meta_folder, language, inid + '.md')
+            if os.path.isfile(i18n_fr):
+                files.append(i18n_fr)
+
+    start = src_dir if src_dir else os.curdir
+    return {os.path.relpath(f, start).replace(os.sep, '/'): file_hash(f)
+            for f in files}
+
+
+def git_shas(inid, git_index, src_dir='', git_data_dir=None):
+    """The last commit of each file the git fields of inid come from
+
+    A commit can change the git fields without changing any file, e.g. the
+    commit of an edit that was built before it was committed.
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        git_index: dict. From sdg.git.get_git_index
+        src_dir: str. Project root directory
+        git_data_dir: str. Alternate folder with versioned data files.
+
+    Returns:
+        dict of path (relative to src_dir) to commit sha
+    """
+    files = sdg.git.subset_git_index(git_index, inid, src_dir=src_dir,
+                                     git_data_dir=git_data_dir)
+    start = os.path.abspath(src_dir if src_dir else os.curdir)
+    return {os.path.relpath(f, start).replace(os.sep, '/'): update['sha']
+            for f, update in files.items()}
+
+
+def indicator_entry(inid, src_dir='', index=None, git_index=None, git_data_dir=None):
+    """What the manifest records about the inputs of one indicator
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        src_dir: str. Project root directory
+        index: ProjectIndex. Which translations exist. Saves looking.
+        git_index: dict. From sdg.git.get_git_index, if the build includes
+            git dates
+        git_data_dir: str. Alternate folder with versioned data files.
+
+    Returns:
+        dict with the 'files' hashes from input_hashes and the 'git' shas
+        from git_shas, or None without a git_index
+    """
+    entry = {'files': input_hashes(inid, src_dir=src_dir, index=index), 'git': None}
+    if git_index is not None:
+        entry['git'] = git_shas(inid, git_index, src_dir=src_dir, git_data_dir=git_data_dir)
+    return entry
+
+
+# %% Read and write
+
+
+def new_manifest(options):
+    """An empty manifest for a build with the given options
+
+    Args:
+        options: dict. Anything that changes the output of every indicator,
+            e.g. whether git dates are included.
+    """
+    return {'version': sdg.__version__,
+            'options': options,
+            'prose': None,
+            'indicators': dict()}
+
+
+def read_manifest(site_dir='_site'):
+    """Read the manifest left by the last build, or None if there isn't one"""
+    pth = os.path.join(site_dir, MANIFEST_FILE)
+    if not os.path.isfile(pth):
+        return None
+    try:
+        with open(pth, encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError as e:
+        print(pth, e)
+        return None
+
+
+def write_manifest(manifest, site_dir='_site'):
+    """Write the manifest into the site directory"""
+    pth = os.path.join(site_dir, MANIFEST_FILE)
+    try:
+        with open(pth, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    except Exception as e:
+        print(pth, e)
+        return False
+    return True
+
+
+# %% Compare
+
+
+def is_compatible(old, new):
+    """Can the indicators recorded in old be reused for a build described by
+    new? Only if they were built by the same version with the same options"""
+    return (old is not None and
+            old.get('version') == new['version'] and
+            old.get('options') == new['options'])
+
+
+def is_unchanged(old, inid, entry):
+    """Are the inputs to inid the same as when old was written?
+
+    Args:
+        old: dict. The manifest of the last build
+        inid: str. The indicator id
+        entry: dict. From indicator_entry
+    """
+    return old['indicators'].get(inid) == entry
@@ -10,32 +10,121 @@ import os
 import yamlmd
 import sdg
 from sdg.path import input_path, output_path  # local package
+from sdg.yaml import safe_load
+
+
+def read_meta_file(pth):
+    """Read a metadata file into its front matter and lines of content
+
+    The same as yamlmd.read_yamlmd, but the front matter is parsed with
+    sdg.yaml, which uses libyaml when it can. Files that don't start with a
+    front matter block are left to yamlmd.
+
+    Args:
+        pth: str. Path to the metadata file
+
+    Returns:
+        list: [front matter dict, list of lines after it]
+    """
+    with open(pth, encoding='utf-8') as f:
+        lines = f.readlines()
+    if not lines or lines[0].rstrip() != '---':
+        return yamlmd.read_yamlmd(pth)
+    for end in range(1, len(lines)):
+        if lines[end].rstrip() == '---':
+            meta = safe_load(''.join(lines[1:end]))
+            if isinstance(meta, dict):
+                return [meta, lines[end + 1:]]
+            break
+    return yamlmd.read_yamlmd(pth)
+
+
+def read_meta_md(inid, src_dir='', languages=None, index=None, meta_cache=None):
+    """Read and parse the metadata file for an indicator and its translations
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        src_dir: str. Project root directory
+        languages: list. Subfolders of meta to look for translations in. If
+            None they are looked up.
+        index: ProjectIndex. Which translations exist, from
+            sdg.path.scan_project. Saves looking for them.
+        meta_cache: MetaCache. Files that haven't changed since they were
+            cached aren't parsed again, see sdg.meta_cache.
+
+    Returns:
+        tuple: (meta_md, translations). meta_md is what read_meta_file
+        gives, the front matter and the lines of content. translations is
+        a dict of language to the same, for the translations that exist.
+    """
+    def read(pth):
+        if meta_cache is None:
+            return read_meta_file(pth)
+        return meta_cache.parse(pth, read_meta_file, kind='yamlmd')
 
-def read_meta(inid, git=True, src_dir='', git_data_dir=None):
-    """Perform pre-processing for the metadata files"""
-    status = True
-    # Read and write paths may be different
     fr = input_path(inid, ftype='meta', src_dir=src_dir)
+    meta_md = read(fr)
+
+    # Now look for all subfolders of the meta folder, which may contain
+    # multilingual metadata, and add them as well.
+    if index is not None:
+        i18n_paths = index.translation_paths(inid)
+    else:
+        meta_folder = input_path(None, ftype='meta', src_dir=src_dir)
+        if languages is None:
+            languages = next(os.walk(meta_folder))[1]
+        i18n_paths = [(language, os.path.join(meta_folder, language, inid + '.md'))
+                      for language in languages]
+        i18n_paths = [(language, i18n_fr) for language, i18n_fr in i18n_paths
+                      if os.path.isfile(i18n_fr)]
+    translations = dict()
+    for language, i18n_fr in i18n_paths:
+        translations[language] = read(i18n_fr)
+
+    return meta_md, translations
+
+
+def read_meta(inid, git=True, src_dir='', git_data_dir=None, git_index=None,
+              meta_md=None, translations=None, languages=None, index=None,
+              meta_cache=None):
+    """Perform pre-processing for the metadata files
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        git: bool. Do you want to check git for last updated dates?
+        src_dir: str. Project root directory
+        git_data_dir: str. Alternate folder with versioned data files.
+        git_index: dict. Output of sdg.git.get_git_index to take the git
+            dates from, rather than asking git about each file.
+        meta_md: list. The metadata file already parsed by read_meta_md.
+            If None the files are read here.
+        translations: dict. The translations from read_meta_md, used
+            along with meta_md.
+        languages: list. Subfolders of meta to look for translations in. If
+            None they are looked up.
+        index: ProjectIndex. Which translations exist, see read_meta_md.
+        meta_cache: MetaCache. Parsed files kept from earlier builds, see
+            read_meta_md.
+    """
+    status = True
+    if meta_md is None:
+        with sdg.profile.stage('parse_meta'):
+            meta_md, translations = read_meta_md(inid, src_dir=src_dir, languages=languages,
+                                                 index=index, meta_cache=meta_cache)
 
-    meta_md = yamlmd.read_yamlmd(fr)
     meta = dict(meta_md[0])
     if git:
-        git_update = sdg.git.get_git_updates(inid, src_dir=src_dir, git_data_dir=git_data_dir)
+        with sdg.profile.stage('git'):
+            git_update = sdg.git.get_git_updates(inid, src_dir=src_dir, git_data_dir=git_data_dir,
+                                                 git_index=git_index)
         for k in git_update.keys():
             meta[k] = git_update[k]
             
     meta['page_content'] = ''.join(meta_md[1])
 
-    # Now look for all subfolders of the meta folder, which may contain
-    # multilingual metadata, and add them as well.
-    meta_folder = input_path(None, ftype='meta', src_dir=src_dir)
-    languages = next(os.walk(meta_folder))[1]
-    for language in languages:
-        i18n_fr = os.path.join(meta_folder, language, inid + '.md')
-        if os.path.isfile(i18n_fr):
-            i18n_meta_md = yamlmd.read_yamlmd(i18n_fr)
-            i18n_meta = dict(i18n_meta_md[0])
-            meta[language] = i18n_meta
-            meta[language]['page_content'] = ''.join(i18n_meta_md[1])
-
-    return meta
\ No newline at end of file
+    for language, i18n_meta_md in translations.items():
+        i18n_meta = dict(i18n_meta_md[0])
+        meta[language] = i18n_meta
+        meta[language]['page_content'] = ''.join(i18n_meta_md[1])
+
+    return meta
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Keep parsed metadata files between builds
+
+Parsing YAML front matter is one of the slower parts of a build, and most
+metadata files don't change from one build to the next. A MetaCache keeps
+what each file parsed to, keyed by its path, along with the hash of its
+contents. It is saved as a pickle, which keeps dates and the like exactly
+as the parser gave them.
+
+A file whose modification time and size haven't changed isn't read at all.
+If they have changed, but the contents hash the same, e.g. after a fresh
+checkout, it still isn't parsed again. Only files whose contents changed
+are parsed.
+
+A pickle can run code when it is loaded, so only use a cache file the build
+itself wrote. Keep it outside site_dir if the site is deployed.
+"""
+
+import functools
+import hashlib
+import os
+import pickle
+import threading
+import sdg
+
+# Bump when the entries change shape
+CACHE_VERSION = 1
+
+# %% Cache
+
+
+def file_hash(pth):
+    """sha1 hex digest of a file's contents"""
+    sha = hashlib.sha1()
+    with open(pth, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class MetaCache(object):
+    """Parsed metadata files, by path
+
+    Args:
+        src_dir: str. Project root directory. Paths are kept relative to it
+            so that the cache still works if the project moves.
+        entries: dict. What an earlier cache held, see read_meta_cache
+    """
+
+    def __init__(self, src_dir='', entries=None):
+        self.src_dir = src_dir
+        self.entries = dict() if entries is None else entries
+        # The entries parsed or updated by this cache
+        self.added = dict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # For worker processes. A lock can't be pickled.
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def key(self, pth):
+        start = self.src_dir if self.src_dir else os.curdir
+        return os.path.relpath(pth, start).replace(os.sep, '/')
+
+    def parse(self, pth, parser, kind):
+        """What parser(pth) gives, from the cache if the file hasn't changed
+
+        Don't change what is returned, it is shared with later calls.
+
+        Args:
+            pth: str. Path to the file
+            parser: function. Parses the file at a path
+            kind: str. The name of the parser. Each kind is kept separately.
+        """
+        key = self.key(pth)
+        st = os.stat(pth)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and entry['stamp'] == stamp and kind in entry['parsed']:
+            return entry['parsed'][kind]
+
+        digest = file_hash(pth)
+        parsed = dict()
+        if entry is not None and entry['hash'] == digest:
+            parsed = dict(entry['parsed'])
+        if kind not in parsed:
+            parsed[kind] = parser(pth)
+        entry = {'hash': digest, 'stamp': stamp, 'parsed': parsed}
+
+        with self.lock:
+            self.entries[key] = entry
+            self.added[key] = entry
+        return entry['parsed'][kind]
+
+    def subset(self, paths):
+        """A cache with just the entries for paths, e.g. to send to a worker
+        process"""
+        keys = [self.key(pth) for pth in paths]
+        return MetaCache(self.src_dir, {k: self.entries[k] for k in keys if k in self.entries})
+
+    def update(self, entries):
+        """Add the entries parsed by another cache, e.g. cache.added from a
+        worker process"""
+        with self.lock:
+            self.entries.update(entries)
+            self.added.update(entries)
+
+    def prune(self):
+        """Forget files that no longer exist"""
+        with self.lock:
+            for key in list(self.entries):
+                if not os.path.isfile(os.path.join(self.src_dir, key)):
+                    del self.entries[key]
+
+
+def run_cached(meta_cache, job):
+    """Call a prepared job that uses meta_cache and also return the entries
+    it parsed
+
+    For process pools, where the entries would otherwise stay in the worker.
+    meta_cache and job must be sent to the worker together, so that they
+    still share the cache there.
+
+    Returns:
+        tuple: (result, entries). Add the entries back with MetaCache.update.
+    """
+    res = job()
+    return res, meta_cache.added
+
+
+def cached_job(meta_cache, paths, func, *args, **kwargs):
+    """Prepare func(*args, meta_cache=..., **kwargs) to run in a worker
+    process with the part of meta_cache for paths. Run it with run_job.
+
+    Returns:
+        A job giving the same as run_cached
+    """
+    subset = meta_cache.subset(paths)
+    job = functools.partial(func, *args, meta_cache=subset, **kwargs)
+    return functools.partial(run_cached, subset, job)
+
+# %% Read and write
+
+
+def read_meta_cache(cache_file, src_dir=''):
+    """Read a cache written by write_meta_cache. Returns an empty cache if the
+    file is missing, can't be read, or is from another version."""
+    cache = MetaCache(src_dir)
+    if cache_file is None or not os.path.isfile(cache_file):
+        return cache
+    try:
+        with open(cache_file, 'rb') as f:
+            saved = pickle.load(f)
+    except Exception as e:
+        print(cache_file, e)
+        return cache
+    if saved.get('version') == CACHE_VERSION and saved.get('sdg') == sdg.__version__:
+        cache.entries = saved['entries']
+    return cache
+
+
+def write_meta_cache(meta_cache, cache_file):
+    """Save the cache, if anything was parsed, forgetting files that no longer
+    exist
+
+    Returns:
+        bool: Status
+    """
+    if not meta_cache.added and os.path.isfile(cache_file):
+        return True
+    meta_cache.prune()
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'sdg': sdg.__version__,
+                         'entries': meta_cache.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_file)
+    except Exception as e:
+        print(cache_file, e)
+        return False
+    return True
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Where an indicator's data has values, worked out once
+
+Headline filtering, edge detection and the empty row check all ask which
+cells are missing. A NullStructure scans the data frame once and keeps a
+bitmask per column of the rows that have a value, packed 64 rows to a word.
+Questions about several columns at once are then bitwise operations on the
+packed masks, which are an eighth of the size of boolean arrays.
+
+    nulls = NullStructure(df)
+    headline_rows = ~nulls.any_present(['Sex', 'Age'])
+"""
+
+import numpy as np
+
+# %% Null structure
+
+
+class NullStructure(object):
+    """The missing values of a data frame
+
+    Args:
+        df: DataFrame
+
+    Attributes:
+        columns: Index. The columns of df
+        rows: int. The number of rows of df
+        bits: numpy uint64 array, a row per column. Bit j is set if row j
+            of the column has a value.
+    """
+
+    def __init__(self, df):
+        self.columns = df.columns
+        self.rows = len(df)
+        # Padded with zeros to a whole number of words
+        words = -(-self.rows // 64)
+        bits = np.zeros((len(df.columns), words * 8), dtype=np.uint8)
+        for i in range(len(df.columns)):
+            packed = np.packbits(df.iloc[:, i].notnull().values)
+            bits[i, :len(packed)] = packed
+        self.bits = bits.view(np.uint64)
+
+    def positions(self, columns=None):
+        """The positions of the columns with these names, or all of them"""
+        if columns is None:
+            return list(range(len(self.columns)))
+        names = set(columns)
+        return [i for i, col in enumerate(self.columns) if col in names]
+
+    def unpack(self, words):
+        """Packed bits back to a boolean per row"""
+        return np.unpackbits(np.ascontiguousarray(words).view(np.uint8),
+                             count=self.rows).astype(bool)
+
+    def present(self, i):
+        """Which rows of the column at position i have a value"""
+        return self.unpack(self.bits[i])
+
+    def any_present(self, columns=None):
+        """Which rows have a value in any of the columns. Rows that are
+        False are empty as far as these columns go.
+
+        Args:
+            columns: list. Column names. None for every column.
+        """
+        bits = self.bits[self.positions(columns)]
+        if len(bits) == 0:
+            return np.zeros(self.rows, dtype=bool)
+        return self.unpack(np.bitwise_or.reduce(bits, axis=0))
+
+    def not_empty(self, columns=None):
+        """Which of the columns have any values"""
+        return self.bits[self.positions(columns)].any(axis=1)
+
+    def present_without(self, columns=None):
+        """Compare the missing values of every pair of the columns
+
+        The same as sdg.edges.x_without_y for every pair of the columns.
+
+        Returns:
+            A columns x columns boolean matrix. Element [i, j] is True if
+            there are any rows where column i is present and column j is
+            empty.
+        """
+        bits = self.bits[self.positions(columns)]
+        without = np.zeros((len(bits), len(bits)), dtype=bool)
+        for i in range(len(bits)):
+            # The padding is never set in bits[i], so it can't match
+            without[i] = (bits[i] & ~bits).any(axis=1)
+        return without
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Write output files only when their content changes
+
+Every writer in sdg.data and sdg.json goes through here. If a file already
+has exactly the new content it is left alone, so its modification time
+doesn't change and rsync or a CDN sees nothing to update. Files that do
+change are written under a temporary name and renamed into place, so
+nothing ever reads half a file.
+
+The files written and skipped are counted, see get_counts.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import hashlib
+import os
+import tempfile
+import threading
+from sdg.profile import add_bytes
+
+# %% Counts
+
+_lock = threading.Lock()
+_counts = Counter()
+
+
+def count(kind, n=1):
+    """Add to the count of 'written' or 'skipped' files"""
+    with _lock:
+        _counts[kind] += n
+
+
+def get_counts():
+    """The number of files written and skipped so far in this process
+
+    Returns:
+        dict with 'written' and 'skipped'
+    """
+    with _lock:
+        return {'written': _counts['written'], 'skipped': _counts['skipped']}
+
+
+def add_counts(counts):
+    """Add counts from get_counts, e.g. from another process"""
+    for kind, n in counts.items():
+        count(kind, n)
+
+
+def run_counted(job):
+    """Call a prepared job and also return the files it wrote and skipped
+
+    For process pools, where the counts would otherwise stay in the worker.
+    The job must be the only thing writing in its process at the time.
+
+    Returns:
+        tuple: (result, counts)
+    """
+    before = get_counts()
+    res = job()
+    after = get_counts()
+    return res, {kind: after[kind] - before[kind] for kind in after}
+
+# %% Compare
+
+
+def content_hash(data):
+    """sha1 hex digest of some bytes"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_hash(pth):
+    """sha1 hex digest of a file's contents"""
+    sha = hashlib.sha1()
+    with open(pth, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def is_unchanged(pth, size, digest):
+    """Does pth already exist with this size and content hash?"""
+    return (os.path.isfile(pth) and os.path.getsize(pth) == size and
+            file_hash(pth) == digest)
+
+# %% Write
+
+
+# Temporary files are made readable only by their owner. Outputs get the
+# permissions an ordinary open would give them.
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def temp_path(pth):
+    """A new, empty file next to pth to write it to before it is moved into
+    place
+
+    The name is unique, so two writers of the same output, e.g. a watch
+    rebuild while a build is running, don't write over each other. The last
+    one to finish wins.
+    """
+    folder, name = os.path.split(pth)
+    fd, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=folder or None)
+    os.close(fd)
+    os.chmod(tmp_path, 0o666 & ~_umask)
+    return tmp_path
+
+
+def write_bytes(pth, data):
+    """Write data to pth, unless pth already holds exactly data
+
+    Returns:
+        bool: True if the file was written, False if it was skipped
+    """
+    if is_unchanged(pth, len(data), content_hash(data)):
+        count('skipped')
+        return False
+
+    tmp_path = temp_path(pth)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, pth)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    count('written')
+    add_bytes(len(data))
+    return True
+
+
+def write_text(pth, text, encoding='utf-8'):
+    """write_bytes for a string"""
+    return write_bytes(pth, text.encode(encoding))
+
+
+def replace_file(tmp_path, pth):
+    """Move a finished temporary file into place, unless pth already holds
+    the same content, in which case the temporary file is just removed
+
+    Returns:
+        bool: True if the file was replaced, False if it was skipped
+    """
+    size = os.path.getsize(tmp_path)
+    if is_unchanged(pth, size, file_hash(tmp_path)):
+        os.remove(tmp_path)
+        count('skipped')
+        return False
+
+    os.replace(tmp_path, pth)
+    count('written')
+    add_bytes(size)
+    return True
+
+
+@contextmanager
+def atomic_path(pth):
+    """A temporary path to write pth to, for writers that need a path
+
+        with atomic_path(out_path) as tmp_path:
+            df.to_csv(tmp_path, index=False)
+
+    On leaving the block the file is moved into place by replace_file. If
+    the block raises the temporary file is removed.
+    """
+    tmp_path = temp_path(pth)
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    replace_file(tmp_path, pth)
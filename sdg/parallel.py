@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Run the same job over many indicators, optionally in parallel
+"""
+
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+POOLS = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}
+
+
+def run_job(job):
+    """Call a prepared job. Pools can only map over module level functions."""
+    return job()
+
+
+@contextmanager
+def pool_map(func, items, workers=1, pool='process'):
+    """Map func over items, in parallel unless workers is 1
+
+    Results come back in the order of items, whatever order the workers
+    finish in, so anything built from them is the same as a serial run.
+
+        with pool_map(func, items, workers=4) as results:
+            for res in results:
+                ...
+
+    Args:
+        func: A module level function (so it can be sent to a process)
+        items: list. The arguments to call func with
+        workers: int. Number of workers. 1 runs everything in this process,
+            None uses every core.
+        pool: str. 'process' or 'thread'
+    """
+    if pool not in POOLS:
+        raise ValueError("pool must be on of: " + ", ".join(POOLS))
+
+    if workers == 1:
+        yield map(func, items)
+        return
+
+    executor = POOLS[pool](max_workers=workers)
+    try:
+        yield executor.map(func, items)
+    finally:
+        executor.shutdown()
@@ -10,7 +10,7 @@ Try to use this as the central location for path related functions
 
 # %% Imports and globals
 
-import glob
+import fnmatch
 import os
 
 # %% Get the IDs by scanning the metadata directory
@@ -23,9 +23,49 @@ def extract_id(md_path):
     return md_id
 
 
+def is_id_file(name):
+    """Is a file in the meta folder an indicator, e.g. 1-1-1.md? Hidden files
+    are left out, as glob does."""
+    return not name.startswith('.') and fnmatch.fnmatch(name, '*-*.md')
+
+
+class DirEntry(object):
+    """The parts of os.DirEntry that list_dir needs, for Python 3.4"""
+
+    def __init__(self, folder, name):
+        self.name = name
+        self.path = os.path.join(folder, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_file(self):
+        return os.path.isfile(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def list_dir(folder):
+    """The entries of a folder, like os.scandir
+
+    os.scandir usually knows whether an entry is a file or folder without
+    another system call, but it is new in Python 3.5 and only a context
+    manager from 3.6. Reading it to the end closes it. On 3.4 the entries
+    come from os.listdir.
+
+    Returns:
+        list of os.DirEntry or DirEntry
+    """
+    if not hasattr(os, 'scandir'):
+        return [DirEntry(folder, name) for name in os.listdir(folder)]
+    return list(os.scandir(folder))
+
+
 def get_ids(src_dir=''):
-    mds = glob.glob(os.path.join(input_path(ftype='meta', src_dir=src_dir), '*-*.md'))
-    ids = [extract_id(md) for md in mds]
+    meta_folder = input_path(ftype='meta', src_dir=src_dir)
+    ids = [extract_id(entry.name) for entry in list_dir(meta_folder)
+           if is_id_file(entry.name)]
 
     return ids
 
@@ -65,10 +105,125 @@ def input_path(inid=None, ftype='data', src_dir='', must_work=False, git_data_di
         path = os.path.join(src_dir, 'meta')
         if inid is not None:
             path = os.path.join(path, inid + '.md')
-    
+
+    if must_work and inid is not None:
+        if not os.path.exists(path):
+            raise IOError(path + ' not found.')
     return path
 
 
+# %% Index of the project files
+
+
+class ProjectIndex(object):
+    """Which input files exist for which indicators
+
+    Made by scan_project, which lists the data and meta folders and the
+    language subfolders of meta once. Everything else is a lookup.
+
+    Attributes:
+        src_dir: str. Project root directory
+        ids: list. Indicator ids, in the order get_ids gives them
+        languages: list. Subfolders of meta, as read_meta finds them
+        data_ids: set. Ids with a data csv
+        translations: dict. Language to the set of ids translated into it
+    """
+
+    def __init__(self, src_dir, ids, languages, data_ids, translations):
+        self.src_dir = src_dir
+        self.ids = ids
+        self.languages = languages
+        self.data_ids = data_ids
+        self.translations = translations
+
+    def data_path(self, inid):
+        """The data csv of an indicator, whether or not it exists"""
+        return input_path(inid, ftype='data', src_dir=self.src_dir)
+
+    def meta_path(self, inid):
+        """The metadata file of an indicator"""
+        return input_path(inid, ftype='meta', src_dir=self.src_dir)
+
+    def has_data(self, inid):
+        return inid in self.data_ids
+
+    def translation_paths(self, inid):
+        """The translations of an indicator's metadata
+
+        Returns:
+            list of (language, path) in the order of languages
+        """
+        meta_folder = input_path(ftype='meta', src_dir=self.src_dir)
+        return [(language, os.path.join(meta_folder, language, inid + '.md'))
+                for language in self.languages if inid in self.translations[language]]
+
+    def subset(self, ids):
+        """An index of just these indicators, e.g. to send to a worker
+        process"""
+        keep = set(ids)
+        return ProjectIndex(self.src_dir, [inid for inid in self.ids if inid in keep],
+                            self.languages, self.data_ids & keep,
+                            {language: translated & keep
+                             for language, translated in self.translations.items()})
+
+    def missing_data(self):
+        """Ids that have metadata but no data csv"""
+        return [inid for inid in self.ids if inid not in self.data_ids]
+
+    def orphaned_data(self):
+        """Ids that have a data csv but no metadata"""
+        ids = set(self.ids)
+        return sorted(inid for inid in self.data_ids if inid not in ids)
+
+    def orphaned_translations(self):
+        """Translations of indicators that have no metadata
+
+        Returns:
+            dict of language to a list of ids, for the languages that have any
+        """
+        ids = set(self.ids)
+        orphans = {language: sorted(inid for inid in self.translations[language]
+                                    if inid not in ids)
+                   for language in self.languages}
+        return {language: orphans[language] for language in self.languages
+                if orphans[language]}
+
+
+def scan_project(src_dir=''):
+    """Index the input files of a project
+
+    Args:
+        src_dir: str. Directory root where data and meta directories exist.
+
+    Returns:
+        ProjectIndex
+    """
+    meta_folder = input_path(ftype='meta', src_dir=src_dir)
+    ids = list()
+    languages = list()
+    for entry in list_dir(meta_folder):
+        if is_id_file(entry.name):
+            ids.append(extract_id(entry.name))
+        if entry.is_dir():
+            languages.append(entry.name)
+
+    translations = dict()
+    for language in languages:
+        entries = list_dir(os.path.join(meta_folder, language))
+        translations[language] = set(extract_id(entry.name) for entry in entries
+                                     if entry.name.endswith('.md') and entry.is_file())
+
+    data_ids = set()
+    data_folder = input_path(ftype='data', src_dir=src_dir)
+    if os.path.isdir(data_folder):
+        for entry in list_dir(data_folder):
+            name = entry.name
+            if name.startswith('indicator_') and name.endswith('.csv') and entry.is_file():
+                data_ids.add(name[len('indicator_'):-len('.csv')])
+
+    return ProjectIndex(src_dir, ids, languages, data_ids, translations)
+
+
 # %% From ID give file path
 
 
@@ -88,6 +243,7 @@ def output_path(inid=None,  ftype='data', format='json', site_dir='_site', must_
         format: str. What data type. One of:
             1. json
             2. csv
+            3. parquet
         site_dir: str. Location to build the site to.
         must_work: bool. If True an IOError is thrown if the file is not found.
 
@@ -100,11 +256,11 @@ def output_path(inid=None,  ftype='data', format='json', site_dir='_site', must_
     if ftype not in expected_ftypes:
         raise ValueError("ftype must be on of: " + ", ".join(expected_ftypes))
 
-    expected_formats = ['csv', 'json']
+    expected_formats = ['csv', 'json', 'parquet']
     if format not in expected_formats:
         raise ValueError("format must be on of: " + ", ".join(expected_formats))
 
-    ext = '.csv' if format == 'csv' else '.json'
+    ext = '.' + format
     path = os.path.join(site_dir, ftype)
     prefix = ''
 
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Time each stage of a build
+
+Profiling is off unless started, for example with build_data(profile=...),
+and a stage costs next to nothing when it is off. When it is on, each stage
+records its wall time, the CPU time of its thread (of the whole process
+before Python 3.7), the bytes it wrote and the indicator it was working on.
+The result is a summary table and a trace in the Chrome trace event format,
+which chrome://tracing and https://ui.perfetto.dev can show as a timeline.
+
+    with stage('edges', inid):
+        edges = edge_detection(inid, data)
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_local = threading.local()
+_profiler = None
+
+# CPU time of the current thread is new in Python 3.7. Before that the whole
+# process is counted, which is the same unless other threads are busy.
+cpu_time = getattr(time, 'thread_time', time.process_time)
+
+# %% Record
+
+
+class Profiler(object):
+    """The stages recorded while profiling was on"""
+
+    def __init__(self):
+        self.events = list()
+
+    def add(self, event):
+        with _lock:
+            self.events.append(event)
+
+    def add_events(self, events):
+        """Add events recorded somewhere else, e.g. in a worker process"""
+        with _lock:
+            self.events.extend(events)
+
+    def totals(self, key='name'):
+        """Add up the events by key ('name' or 'inid')
+
+        Returns:
+            dict of key to dict with 'calls', 'wall', 'cpu' and 'bytes'
+        """
+        totals = dict()
+        for event in self.events:
+            k = event['args'][key] if key == 'inid' else event[key]
+            if k is None:
+                continue
+            total = totals.setdefault(k, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes': 0})
+            total['calls'] += 1
+            total['wall'] += event['dur'] / 1e6
+            total['cpu'] += event['args']['cpu_ms'] / 1e3
+            total['bytes'] += event['args']['bytes']
+        return totals
+
+    def summary(self, top=10):
+        """A table of the time spent in each stage and the slowest indicators
+
+        Wall time is added up across workers, so it can be more than the
+        time the build took.
+        """
+        lines = ['{:<20} {:>7} {:>10} {:>10} {:>12}'.format(
+            'stage', 'calls', 'wall s', 'cpu s', 'MB written')]
+        stages = self.totals('name')
+        for name in sorted(stages, key=lambda name: -stages[name]['wall']):
+            total = stages[name]
+            lines.append('{:<20} {:>7} {:>10.3f} {:>10.3f} {:>12.3f}'.format(
+                name, total['calls'], total['wall'], total['cpu'], total['bytes'] / 1e6))
+
+        indicators = {event['args']['inid']: event for event in self.events
+                      if event['name'] == 'indicator'}
+        if indicators:
+            lines.append('')
+            lines.append('{:<20} {:>10} {:>10} {:>12}'.format(
+                'slowest indicators', 'wall s', 'cpu s', 'MB written'))
+            for inid in sorted(indicators, key=lambda inid: -indicators[inid]['dur'])[:top]:
+                event = indicators[inid]
+                lines.append('{:<20} {:>10.3f} {:>10.3f} {:>12.3f}'.format(
+                    inid, event['dur'] / 1e6, event['args']['cpu_ms'] / 1e3,
+                    event['args']['bytes'] / 1e6))
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        """The events as a Chrome trace event format object"""
+        return {'traceEvents': sorted(self.events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms'}
+
+    def write_trace(self, pth):
+        """Write the Chrome trace to pth
+
+        Returns:
+            bool: Status
+        """
+        try:
+            with open(pth, 'w', encoding='utf-8') as f:
+                json.dump(self.chrome_trace(), f)
+        except Exception as e:
+            print(pth, e)
+            return False
+        return True
+
+
+def start():
+    """Start profiling in this process
+
+    Returns:
+        Profiler: Where the stages are recorded
+    """
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def stop():
+    """Stop profiling
+
+    Returns:
+        Profiler: What was recorded, or None if profiling wasn't on
+    """
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    return profiler
+
+
+def is_active():
+    return _profiler is not None
+
+
+def add_events(events):
+    """Add events recorded in another process, if profiling is on"""
+    if _profiler is not None:
+        _profiler.add_events(events)
+
+
+@contextmanager
+def profiling(trace=None):
+    """Profile a block of code then print the summary
+
+    Args:
+        trace: str. Optional path to write the Chrome trace to
+    """
+    profiler = start()
+    try:
+        yield profiler
+    finally:
+        stop()
+        print(profiler.summary())
+        if trace is not None:
+            profiler.write_trace(trace)
+
+
+def run_profiled(job):
+    """Call a prepared job, profiling it on its own
+
+    For process pools, where the events would otherwise stay in the worker.
+    The job must be the only thing running in its process at the time.
+
+    Returns:
+        tuple: (result, events)
+    """
+    global _profiler
+    outer = _profiler
+    _profiler = Profiler()
+    try:
+        res = job()
+        events = _profiler.events
+    finally:
+        _profiler = outer
+    return res, events
+
+# %% Stages
+
+
+@contextmanager
+def stage(name, inid=None):
+    """Record the time spent in a block of code
+
+    Args:
+        name: str. What the stage is, e.g. 'read_csv'
+        inid: str. The indicator. Stages inside another stage take its
+            indicator by default.
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = list()
+    if inid is None and stack:
+        inid = stack[-1]['inid']
+    current = {'inid': inid, 'bytes': 0}
+    stack.append(current)
+
+    start_wall = time.perf_counter()
+    start_cpu = cpu_time()
+    try:
+        yield
+    finally:
+        cpu = cpu_time() - start_cpu
+        wall = time.perf_counter() - start_wall
+        stack.pop()
+        # Bytes written count towards every stage they were written in
+        if stack:
+            stack[-1]['bytes'] += current['bytes']
+        profiler.add({'name': name, 'cat': 'sdg', 'ph': 'X',
+                      'ts': start_wall * 1e6, 'dur': wall * 1e6,
+                      'pid': os.getpid(), 'tid': threading.get_ident(),
+                      'args': {'inid': inid, 'cpu_ms': cpu * 1e3,
+                               'bytes': current['bytes']}})
+
+
+def run_stage(name, inid, func, *args, **kwargs):
+    """Call func inside a stage. A module level function, so that it can be
+    sent to a worker process with functools.partial."""
+    with stage(name, inid):
+        return func(*args, **kwargs)
+
+
+def add_bytes(n):
+    """Count bytes written towards the current stage"""
+    if _profiler is None:
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1]['bytes'] += n
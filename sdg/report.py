@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Results of the csv and metadata checks, and reports of them
+
+Each problem found is a CheckResult. The checks for one file give a list of
+them, empty if the file is fine. check_all_csv and check_all_meta collect
+one list per file and can write them out as a JSON or JUnit XML report for
+CI systems.
+"""
+
+from collections import namedtuple
+import json
+import os
+import xml.etree.ElementTree as ET
+
+# %% Results
+
+
+# One problem found in a file. column is the csv column or metadata field,
+# rows are the 0-based row positions affected; either can be None. message
+# is exactly what gets printed.
+CheckResult = namedtuple('CheckResult', ['file', 'check', 'column', 'rows', 'message'])
+
+
+def result(fname, check, *args, column=None, rows=None):
+    """Make a CheckResult whose message is the args printed after fname"""
+    message = ' '.join(str(x) for x in (fname,) + args)
+    return CheckResult(fname, check, column, rows, message)
+
+
+def print_results(results):
+    """Print the messages and return the status, True if there were none"""
+    for res in results:
+        print(res.message)
+    return len(results) == 0
+
+# %% Reports
+
+
+def result_dict(res):
+    """A CheckResult as a JSON ready dict"""
+    rows = None if res.rows is None else [int(row) for row in res.rows]
+    return {'check': res.check, 'column': res.column, 'rows': rows,
+            'message': res.message}
+
+
+def report_json(name, files):
+    """A JSON report
+
+    Args:
+        name: str. What was checked, e.g. 'csv'
+        files: list. (file, results) pairs in the order they were checked
+
+    Returns:
+        str
+    """
+    report = {'name': name,
+              'status': all(len(results) == 0 for f, results in files),
+              'files': [{'file': f,
+                         'status': len(results) == 0,
+                         'results': [result_dict(res) for res in results]}
+                        for f, results in files]}
+    return json.dumps(report, indent=2)
+
+
+def report_junit(name, files):
+    """A JUnit XML report with a test case per file
+
+    Args:
+        name: str. What was checked, e.g. 'csv'
+        files: list. (file, results) pairs in the order they were checked
+
+    Returns:
+        str
+    """
+    failures = sum(len(results) > 0 for f, results in files)
+    suite = ET.Element('testsuite', name=name, tests=str(len(files)),
+                       failures=str(failures), errors='0')
+    for f, results in files:
+        case = ET.SubElement(suite, 'testcase', classname='sdg.' + name, name=f)
+        for res in results:
+            failure = ET.SubElement(case, 'failure', type=res.check, message=res.message)
+            failure.text = res.message
+    return ET.tostring(suite, encoding='unicode')
+
+
+REPORT_FORMATS = {'json': report_json, 'junit': report_junit}
+
+
+def write_report(pth, name, files, format=None):
+    """Write a report of the checks
+
+    Args:
+        pth: str. Where to write the report
+        name: str. What was checked, e.g. 'csv'
+        files: list. (file, results) pairs in the order they were checked
+        format: str. 'json' or 'junit'. If None then it is 'junit' for a
+            .xml file and 'json' otherwise.
+
+    Returns:
+        bool: Status
+    """
+    if format is None:
+        format = 'junit' if pth.endswith('.xml') else 'json'
+    if format not in REPORT_FORMATS:
+        raise ValueError("format must be on of: " + ", ".join(REPORT_FORMATS))
+
+    try:
+        report_dir = os.path.dirname(pth)
+        if report_dir and not os.path.exists(report_dir):
+            os.makedirs(report_dir, exist_ok=True)
+        with open(pth, 'w', encoding='utf-8') as f:
+            f.write(REPORT_FORMATS[format](name, files))
+    except Exception as e:
+        print(pth, e)
+        return False
+
+    return True
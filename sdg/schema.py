@@ -8,8 +8,8 @@ Information about the metadata fields
 
 # %% Imports and globals
 
-import yaml
 import os
+from sdg.yaml import safe_load_all
 
 # %% Read schema
 
@@ -28,7 +28,7 @@ def get_schema(prose_file='_prose.yml', src_dir=''):
     prose_path = os.path.join(src_dir, prose_file)
 
     with open(prose_path, encoding="UTF-8") as stream:
-        config = next(yaml.safe_load_all(stream))
+        config = next(safe_load_all(stream))
 
     all_fields = config['prose']['metadata']['meta']
 
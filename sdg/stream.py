@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Build the data outputs of a very big indicator a chunk of rows at a time
+
+Some indicators have millions of rows, e.g. local authority by year by sex
+by age, and reading them whole can take more memory than the build has.
+With build_data(chunksize=...) their csv is read twice in chunks of rows:
+
+    1. The first pass works out the type each column would have had if the
+       whole file had been read at once. Otherwise a column of whole numbers
+       with a gap in a later chunk would be written as 1 in one chunk and
+       1.0 in another.
+    2. The second pass reads every chunk with those types and writes the
+       data csv, json and parquet as it goes. The missing values of each
+       chunk are added to what edge detection needs, see
+       sdg.nulls.NullStructure, and its headline rows are kept.
+
+The outputs are the same as an ordinary build, but for a column that mixes
+numbers with text. read_csv types a big file a block of rows at a time, so
+an ordinary build writes the numbers in blocks without any text as numbers
+and the rest as text. Here the whole column is text, see column_dtype.
+Quote such a column's values, or make them all text, if it matters.
+
+At most one chunk is in memory at a time, plus the headline rows. The json data output is a column
+at a time, so each column is spooled to a temporary file until the end.
+"""
+
+import contextlib
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+from sdg.context import prepare_output
+from sdg.data import filter_headline, parquet_frame, write_csv, write_parquet
+from sdg.edges import check_headers, edge_columns
+from sdg.edges import edges_from_presence, prune_grand_parents
+from sdg.json import dumps, encode_column, encode_df, write_json_string
+from sdg.nulls import NullStructure
+from sdg.output import atomic_path
+
+# %% Column types
+
+
+def fits_in_chunk(pth, chunksize):
+    """Does the csv at pth have no more than chunksize rows?"""
+    return len(pd.read_csv(pth, nrows=chunksize + 1, usecols=[0])) <= chunksize
+
+
+def chunk_kind(col):
+    """What one chunk of a column holds: 'empty', 'integer', 'floating',
+    'boolean' or 'string'"""
+    if not col.notnull().any():
+        return 'empty'
+    if pd.api.types.is_bool_dtype(col.dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(col.dtype):
+        return 'integer'
+    if pd.api.types.is_float_dtype(col.dtype):
+        return 'floating'
+    # Booleans with missing values are read as objects
+    if pd.api.types.infer_dtype(col, skipna=True) == 'boolean':
+        return 'boolean'
+    return 'string'
+
+
+def column_dtype(kinds, missing):
+    """The type read_csv would give a whole column
+
+    Args:
+        kinds: set. The chunk_kind of every chunk of the column
+        missing: bool. Does the column have any missing values?
+
+    Returns:
+        The dtype to read every chunk with, or None for booleans with missing
+        values. Those are read as they come and made objects afterwards.
+    """
+    kinds = kinds - set(['empty'])
+    if not kinds:
+        return 'float64'
+    if kinds == set(['integer']):
+        return 'float64' if missing else 'int64'
+    if kinds <= set(['integer', 'floating']):
+        return 'float64'
+    if kinds == set(['boolean']):
+        return None if missing else 'bool'
+    # Anything else is kept as the text in the file, even the numbers, so
+    # that every chunk is the same
+    return 'object'
+
+
+def scan_dtypes(pth, chunksize):
+    """The first pass: the type of every column of the csv at pth
+
+    Returns:
+        dict of column to column_dtype, in the order of the columns
+    """
+    kinds = dict()
+    missing = dict()
+    for chunk in pd.read_csv(pth, chunksize=chunksize):
+        for col in chunk.columns:
+            kinds.setdefault(col, set()).add(chunk_kind(chunk[col]))
+            missing[col] = missing.get(col, False) or bool(chunk[col].isnull().any())
+    return {col: column_dtype(kinds[col], missing[col]) for col in kinds}
+
+
+def read_chunks(pth, dtypes, chunksize):
+    """The second pass: read the csv chunksize rows at a time, every chunk
+    with the same column types
+
+    Args:
+        pth: str. Path to the csv
+        dtypes: dict. From scan_dtypes
+        chunksize: int. Rows in each chunk
+
+    Returns:
+        Iterator of DataFrames
+    """
+    read_dtypes = {col: dtype for col, dtype in dtypes.items() if dtype is not None}
+    for chunk in pd.read_csv(pth, dtype=read_dtypes, chunksize=chunksize):
+        for col, dtype in dtypes.items():
+            if dtype is None:
+                chunk[col] = chunk[col].astype(object)
+        yield chunk
+
+# %% Streamed outputs
+
+
+class ColumnSpool(object):
+    """Build up a JSON object of lists, as df_to_json(df, orient='list')
+    gives, a chunk of rows at a time
+
+    Each column's values are written to their own temporary file, which are
+    joined up by copy_to.
+    """
+
+    def __init__(self, columns):
+        self.keys = [dumps(col) for col in columns]
+        self.files = [tempfile.TemporaryFile('w+', encoding='utf-8') for col in columns]
+        self.sep = ''
+
+    def add(self, chunk):
+        for i, f in enumerate(self.files):
+            f.write(self.sep + ','.join(encode_column(chunk.iloc[:, i])))
+        self.sep = ','
+
+    def copy_to(self, out):
+        """Write the whole JSON object to the open file out"""
+        out.write('{')
+        for i, (key, f) in enumerate(zip(self.keys, self.files)):
+            f.seek(0)
+            out.write((',' if i > 0 else '') + key + ':[')
+            shutil.copyfileobj(f, out)
+            out.write(']')
+        out.write('}')
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+def parquet_schema(table, dtypes):
+    """The schema for every chunk of a parquet file, from the first chunk
+
+    A column that is empty in the first chunk has no type yet. Give it the
+    type it has in the rest of the file.
+    """
+    schema = table.schema
+    for i, field in enumerate(schema):
+        if pyarrow.types.is_null(field.type):
+            if dtypes.get(field.name) is None:
+                schema = schema.set(i, field.with_type(pyarrow.bool_()))
+            elif dtypes[field.name] == 'object':
+                schema = schema.set(i, field.with_type(pyarrow.string()))
+    return schema
+
+# %% Build
+
+
+def write_data_chunked(inid, pth, chunksize, json_engine='dict', parquet=False,
+                       site_dir='', context=None):
+    """Write the data, edges and headline outputs of one indicator, reading
+    its csv chunksize rows at a time
+
+    Args:
+        inid: str. The indicator id, e.g. '1-1-1'
+        pth: str. Path to the indicator csv
+        chunksize: int. Rows in each chunk
+        json_engine: str. How the edges and headline are encoded, see
+            sdg.build.build_indicator. The data is always encoded a column
+            at a time. The output is the same.
+        parquet: bool. Also write data, edges and headline as parquet.
+        site_dir: str. Directory to build the site to
+        context: BuildContext. Optional, saves checking the directories exist
+
+    Returns:
+        tuple: (status, headline_json) as sdg.build.write_data_outputs
+    """
+    status = True
+    out = dict(site_dir=site_dir, context=context)
+
+    dtypes = scan_dtypes(pth, chunksize)
+    columns = pd.Index(list(dtypes))
+    check_headers(inid, pd.DataFrame(columns=columns))
+
+    # What edge detection needs, added up over the chunks
+    cols = edge_columns(columns)
+    without = np.zeros((len(cols), len(cols)), dtype=bool)
+    not_empty = np.zeros(len(cols), dtype=bool)
+    headlines = list()
+
+    spool = ColumnSpool(columns)
+    try:
+        with contextlib.ExitStack() as stack:
+            csv_path = prepare_output(inid, ftype='data', format='csv', **out)
+            csv_file = stack.enter_context(
+                open(stack.enter_context(atomic_path(csv_path)), 'w',
+                     encoding='utf-8', newline=''))
+            parquet_path = None
+            writer = None
+            if parquet:
+                parquet_path = stack.enter_context(atomic_path(
+                    prepare_output(inid, ftype='data', format='parquet', **out)))
+
+            for i, chunk in enumerate(read_chunks(pth, dtypes, chunksize)):
+                nulls = NullStructure(chunk)
+                without = without | nulls.present_without(cols)
+                not_empty = not_empty | nulls.not_empty(cols)
+                headlines.append(filter_headline(chunk, nulls=nulls))
+
+                chunk.to_csv(csv_file, index=False, header=(i == 0))
+                spool.add(chunk)
+                if parquet:
+                    table = pyarrow.Table.from_pandas(parquet_frame(chunk), preserve_index=False)
+                    if writer is None:
+                        schema = parquet_schema(table, dtypes)
+                        writer = stack.enter_context(
+                            pyarrow.parquet.ParquetWriter(parquet_path, schema))
+                    writer.write_table(table.cast(schema))
+
+        edges = prune_grand_parents(edges_from_presence(cols, without, not_empty))
+        edges_json = encode_df(edges, orient='list', engine=json_engine)
+
+        data_path = prepare_output(inid, ftype='data', format='json', **out)
+        with atomic_path(data_path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+            spool.copy_to(f)
+        comb_path = prepare_output(inid, ftype='comb', format='json', **out)
+        with atomic_path(comb_path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('{' + dumps('data') + ':')
+            spool.copy_to(f)
+            f.write(',' + dumps('edges') + ':' + edges_json + '}')
+    finally:
+        spool.close()
+
+    headline = pd.concat(headlines)
+    headline_json = encode_df(headline, orient='records', engine=json_engine)
+
+    status = status & write_csv(inid, edges, ftype='edges', **out)
+    status = status & write_csv(inid, headline, ftype='headline', **out)
+    if parquet:
+        status = status & write_parquet(inid, edges, ftype='edges', **out)
+        status = status & write_parquet(inid, headline, ftype='headline', **out)
+    status = status & write_json_string(inid, edges_json, ftype='edges', gz=False, **out)
+    status = status & write_json_string(inid, headline_json, ftype='headline', gz=False, **out)
+
+    return status, headline_json
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Rebuild indicators as their files change
+
+For editing indicators locally. After one full build_data the project is
+polled for changes. Only the indicators whose data, metadata or
+translations changed are rebuilt. The "all" outputs are rewritten from
+results kept in memory, and the schema is rewritten if _prose.yml changed.
+Polling only needs the standard library, so it works anywhere, including
+on network and container filesystems where inotify events don't arrive.
+
+    python -m sdg.watch --src-dir . --site-dir _site
+"""
+
+import argparse
+import os
+import time
+import sdg
+from sdg.path import input_path, extract_id, is_id_file, list_dir
+
+PROSE_FILE = '_prose.yml'
+
+# %% Find changes
+
+
+def snapshot(src_dir=''):
+    """The modification time and size of every input file
+
+    Returns:
+        dict of path to (mtime_ns, size)
+    """
+    files = dict()
+
+    def add(folder, keep):
+        if not os.path.isdir(folder):
+            return
+        for entry in list_dir(folder):
+            if keep(entry):
+                st = entry.stat()
+                files[entry.path] = (st.st_mtime_ns, st.st_size)
+
+    meta_folder = input_path(ftype='meta', src_dir=src_dir)
+    add(meta_folder, lambda entry: is_id_file(entry.name) and entry.is_file())
+    if os.path.isdir(meta_folder):
+        languages = [entry.path for entry in list_dir(meta_folder) if entry.is_dir()]
+        for language in languages:
+            add(language, lambda entry: entry.name.endswith('.md') and entry.is_file())
+    add(input_path(ftype='data', src_dir=src_dir),
+        lambda entry: entry.name.startswith('indicator_') and entry.name.endswith('.csv'))
+
+    prose_path = os.path.join(src_dir, PROSE_FILE)
+    if os.path.isfile(prose_path):
+        st = os.stat(prose_path)
+        files[prose_path] = (st.st_mtime_ns, st.st_size)
+
+    return files
+
+
+def changed_files(old, new):
+    """Paths that were added, removed or modified between two snapshots"""
+    return set(pth for pth in set(old) | set(new) if old.get(pth) != new.get(pth))
+
+
+def file_id(pth):
+    """The indicator an input file belongs to, or None for _prose.yml"""
+    name = os.path.basename(pth)
+    if name == PROSE_FILE:
+        return None
+    if name.startswith('indicator_'):
+        name = name[len('indicator_'):]
+    return extract_id(name)
+
+# %% Watch
+
+
+class Watcher(object):
+    """Keep a site up to date with its inputs
+
+    Args:
+        src_dir: str. Project root directory
+        site_dir: str. Directory to build the site to
+        interval: float. Seconds between polls
+        options: Any other options of build_data. Those that build_indicator
+            also takes are used for the rebuilds.
+    """
+
+    def __init__(self, src_dir='', site_dir='_site', interval=1.0, **options):
+        self.src_dir = src_dir
+        self.site_dir = site_dir
+        self.interval = interval
+        self.options = options
+        self.results = dict()
+        self.files = dict()
+        self.context = None
+
+    def indicator_options(self):
+        """The options passed on to build_indicator"""
+        keep = ['git', 'git_data_dir', 'json_engine', 'typed', 'csv_engine', 'parquet',
+                'chunksize']
+        return {k: v for k, v in self.options.items() if k in keep}
+
+    def build(self):
+        """Build everything and remember the results
+
+        Returns:
+            bool: Status
+        """
+        self.files = snapshot(self.src_dir)
+        status = sdg.build_data(src_dir=self.src_dir, site_dir=self.site_dir, **self.options)
+        self.context = sdg.context.BuildContext(src_dir=self.src_dir, site_dir=self.site_dir)
+        self.results = {inid: sdg.build.load_indicator(inid, site_dir=self.site_dir)
+                        for inid in self.context.index.ids}
+        return status
+
+    def update(self):
+        """Rebuild whatever changed since the last build or update
+
+        Returns:
+            list: The indicators that were rebuilt
+        """
+        files = snapshot(self.src_dir)
+        changed = changed_files(self.files, files)
+        self.files = files
+        if not changed:
+            return []
+
+        # Indicators may have come or gone
+        self.context = sdg.context.BuildContext(src_dir=self.src_dir, site_dir=self.site_dir)
+        ids = self.context.index.ids
+        affected = set(file_id(pth) for pth in changed)
+
+        if None in affected:
+            print("Rebuilding schema...")
+            try:
+                schema = sdg.schema.get_schema(prose_file=PROSE_FILE, src_dir=self.src_dir)
+                sdg.json.write_json('schema', schema, ftype='meta', context=self.context)
+            except Exception as e:
+                print(PROSE_FILE, e)
+
+        rebuilt = [inid for inid in ids if inid in affected]
+        for inid in rebuilt:
+            print("Rebuilding " + inid + "...")
+            try:
+                self.results[inid] = sdg.build.build_indicator(
+                    inid, src_dir=self.src_dir, site_dir=self.site_dir,
+                    context=self.context, **self.indicator_options())
+            except Exception as e:
+                # Keep going with the last good build of this indicator
+                print(inid, e)
+
+        for inid in list(self.results):
+            if inid not in ids:
+                del self.results[inid]
+
+        self.write_all(ids)
+
+        if self.options.get('compress'):
+            pths = [sdg.path.output_path('all', ftype=ftype, format='json', site_dir=self.site_dir)
+                    for ftype in ['meta', 'headline']]
+            if None in affected:
+                pths.append(sdg.path.output_path('schema', ftype='meta', format='json',
+                                                 site_dir=self.site_dir))
+            for inid in rebuilt:
+                pths = pths + sdg.build.indicator_outputs(inid, site_dir=self.site_dir)
+            self.compress(pths)
+
+        return rebuilt
+
+    def compress(self, pths):
+        """Refresh the compressed copies of some outputs"""
+        formats = self.options['compress']
+        if isinstance(formats, str):
+            formats = [formats]
+        for pth in pths:
+            if os.path.exists(pth):
+                sdg.compress.compress_file(pth, formats=formats,
+                                           level=self.options.get('compress_level', 9))
+
+    def write_all(self, ids):
+        """Write the "all" outputs from the results in memory"""
+        with sdg.json.JSONObjectWriter('all', ftype='meta', context=self.context) as all_meta, \
+                sdg.json.JSONObjectWriter('all', ftype='headline', context=self.context) as all_headline:
+            for inid in ids:
+                if inid in self.results:
+                    status, meta, headline = self.results[inid]
+                    all_meta.add(inid, meta)
+                    all_headline.add(inid, headline)
+
+        if self.options.get('parquet'):
+            for ftype in ['data', 'edges', 'headline']:
+                sdg.data.write_parquet_all([inid for inid in ids if inid in self.results],
+                                           ftype=ftype, context=self.context)
+
+    def run(self):
+        """Build, then poll for changes until interrupted"""
+        self.build()
+        print("Watching " + os.path.abspath(self.src_dir or os.curdir) + " for changes...")
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.update()
+        except KeyboardInterrupt:
+            pass
+
+
+def watch(src_dir='', site_dir='_site', interval=1.0, **options):
+    """Build the site and keep rebuilding what changes until interrupted
+
+    Args:
+        src_dir: str. Project root directory
+        site_dir: str. Directory to build the site to
+        interval: float. Seconds between polls
+        options: Any other options of build_data
+    """
+    Watcher(src_dir=src_dir, site_dir=site_dir, interval=interval, **options).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--src-dir', default='')
+    parser.add_argument('--site-dir', default='_site')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between polls')
+    parser.add_argument('--git', action='store_true',
+                        help='look up last updated dates in git')
+    args = parser.parse_args()
+    watch(src_dir=args.src_dir, site_dir=args.site_dir, interval=args.interval,
+          git=args.git)
+
+
+if __name__ == '__main__':
+    main()
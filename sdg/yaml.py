@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Parse YAML with libyaml when it is there
+
+PyYAML's own parser is written in Python and is the slowest part of reading
+metadata. If PyYAML was built against libyaml it also has CSafeLoader, which
+does the same job in C many times faster. Everything in the package that
+reads YAML comes through here so that it uses the C loader when it can, and
+the pure Python SafeLoader otherwise. Both give the same results.
+
+    meta = sdg.yaml.safe_load(text)
+"""
+
+import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Is the C loader being used?
+LIBYAML = SafeLoader is not yaml.SafeLoader
+
+# %% Load
+
+
+def safe_load(stream):
+    """yaml.safe_load, with the fastest loader there is
+
+    Args:
+        stream: str or open file
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def safe_load_all(stream):
+    """yaml.safe_load_all, with the fastest loader there is. Documents are
+    parsed as they are asked for, so the first can be read from a file
+    whose later documents aren't YAML, e.g. the front matter of a metadata
+    file.
+
+    Args:
+        stream: str or open file
+
+    Returns:
+        Iterator of documents
+    """
+    return yaml.load_all(stream, Loader=SafeLoader)
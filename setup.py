@@ -13,6 +13,7 @@ setup(name='sdg',
       zip_safe=False,
       python_requires='>=3.4',
       install_requires=['pyyaml', 'gitpython', 'pandas', 'yamlmd'],
+      extras_require={'parquet': ['pyarrow'], 'brotli': ['brotli']},
       dependency_links=[
         "git+ssh://git@github.com/dougmet/yamlmd.git@0.1.7"
     ])
@@ -2,10 +2,14 @@ import pytest
 import os
 import json
 import shutil
+import gzip
+import time
 import numpy as np
 import pandas as pd
-from sdg import build_data
+import sdg
+from sdg import build_data, check_and_build
 from sdg.path import output_path, input_path, get_ids
+from sdg.data import read_data
 
 src_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -80,3 +84,302 @@ def test_built_comb_data(test_site_dir):
     ids = get_ids(src_dir=src_dir)
     for inid in ids:
         assert compare_reload_data(inid, src_dir=src_dir, site_dir=test_site_dir)
+
+
+def read_site(site_dir):
+    """Read every built file into a dict keyed by its path within site_dir"""
+    files = dict()
+    for root, dirs, fnames in os.walk(site_dir):
+        for fname in fnames:
+            pth = os.path.join(root, fname)
+            with open(pth, 'rb') as f:
+                files[os.path.relpath(pth, site_dir)] = f.read()
+    return files
+
+
+def test_parallel_build(test_site_dir, tmpdir):
+    """A parallel build must write exactly the same files as a serial one"""
+    site_dir = str(tmpdir.mkdir('_site_parallel'))
+
+    build_result = build_data(src_dir=src_dir, site_dir=site_dir, git=False,
+                              workers=2)
+    assert build_result
+
+    assert read_site(site_dir) == read_site(test_site_dir)
+
+
+def test_incremental_build(test_site_dir, tmpdir):
+    """An incremental build should only rebuild what changed, but still give
+    the same site as a full build"""
+    proj_dir = str(tmpdir.join('project'))
+    site_dir = str(tmpdir.join('_site_incremental'))
+    for folder in ['data', 'meta']:
+        shutil.copytree(os.path.join(src_dir, folder), os.path.join(proj_dir, folder))
+    shutil.copy(os.path.join(src_dir, '_prose.yml'), proj_dir)
+
+    assert build_data(src_dir=proj_dir, site_dir=site_dir, git=False,
+                      incremental=True)
+    assert os.path.exists(os.path.join(site_dir, 'manifest.json'))
+    first = read_site(site_dir)
+    del first['manifest.json']
+    assert first == read_site(test_site_dir)
+
+    # Change one data file and build again
+    csv_path = input_path('1-2-1', ftype='data', src_dir=proj_dir)
+    df = pd.read_csv(csv_path)
+    df['Value'] = df['Value'] + 1
+    df.to_csv(csv_path, index=False)
+
+    assert build_data(src_dir=proj_dir, site_dir=site_dir, git=False,
+                      incremental=True)
+    second = read_site(site_dir)
+
+    changed = set(k for k in second if second[k] != first.get(k))
+    assert 'data/1-2-1.csv' in changed
+    assert 'headline/all.json' in changed
+    assert not any('9-3-1' in k for k in changed)
+
+
+def test_columnar_build(test_site_dir, tmpdir):
+    """The columnar JSON engine must write exactly the same files"""
+    site_dir = str(tmpdir.mkdir('_site_columnar'))
+
+    build_result = build_data(src_dir=src_dir, site_dir=site_dir, git=False,
+                              json_engine='columnar')
+    assert build_result
+
+    assert read_site(site_dir) == read_site(test_site_dir)
+
+
+def test_compressed_build(test_site_dir, tmpdir):
+    """Every output should get a gzipped copy with the same content"""
+    site_dir = str(tmpdir.mkdir('_site_gz'))
+
+    build_result = build_data(src_dir=src_dir, site_dir=site_dir, git=False,
+                              compress='gz')
+    assert build_result
+
+    files = read_site(site_dir)
+    originals = read_site(test_site_dir)
+    assert set(files) == set(originals) | set(f + '.gz' for f in originals)
+    for f in originals:
+        assert gzip.decompress(files[f + '.gz']) == originals[f]
+
+
+
+def test_compress_levels():
+    """Each format takes its own level, and levels it doesn't accept are
+    refused before the build starts"""
+    assert sdg.compress.format_levels(['gz', 'br'], {'gz': 6, 'br': 11}) == {'gz': 6, 'br': 11}
+    assert sdg.compress.format_levels(['gz'], {'br': 11}) == {'gz': 9}
+    with pytest.raises(ValueError):
+        sdg.compress.format_levels(['gz', 'br'], 11)
+    with pytest.raises(ValueError):
+        build_data(src_dir=src_dir, site_dir='_never_written', git=False,
+                   compress='gz', compress_level=11)
+    assert not os.path.exists('_never_written')
+
+def test_check_and_build(test_site_dir, tmpdir):
+    """Checking while building must not change the outputs"""
+    site_dir = str(tmpdir.mkdir('_site_checked'))
+    report = os.path.join(str(tmpdir), 'check.json')
+
+    build_result = check_and_build(src_dir=src_dir, site_dir=site_dir, git=False,
+                                   workers=2, report=report)
+    assert build_result
+
+    assert read_site(site_dir) == read_site(test_site_dir)
+    with open(report) as f:
+        checked = json.load(f)
+    assert checked['status']
+    assert len(checked['files']) == 2 * len(get_ids(src_dir=src_dir))
+
+
+def test_typed_build(test_site_dir, tmpdir):
+    """Reading the disaggregations as categories must not change the outputs"""
+    site_dir = str(tmpdir.mkdir('_site_typed'))
+
+    build_result = build_data(src_dir=src_dir, site_dir=site_dir, git=False,
+                              typed=True)
+    assert build_result
+
+    assert read_site(site_dir) == read_site(test_site_dir)
+
+
+def test_read_data_typed(tmpdir):
+    """Only columns of words become categories"""
+    pth = str(tmpdir.join('typed.csv'))
+    with open(pth, 'w') as f:
+        f.write('Year,Sex,Age,Flag,Value\n'
+                '2015,Male,15,True,1\n'
+                '2016,,,False,2.5\n')
+
+    df = read_data(pth, typed=True)
+    plain = pd.read_csv(pth)
+    assert str(df['Sex'].dtype) == 'category'
+    for col in ['Year', 'Age', 'Flag', 'Value']:
+        assert df[col].dtype == plain[col].dtype
+    assert df.to_csv(index=False) == plain.to_csv(index=False)
+
+
+def write_mixed_csv(pth, rows=300000):
+    """A csv whose Code column is numbers, but for text in the last row.
+    It is long enough for read_csv to type the column a block at a time."""
+    with open(pth, 'w') as f:
+        f.write('Year,Code,Value\n')
+        f.write(''.join('2015,%d,1\n' % (i % 50) for i in range(rows - 1)))
+        f.write('2015,A4,1\n')
+
+
+def test_read_data_typed_mixed(tmpdir):
+    """A column mixing numbers and words is read as pandas reads it"""
+    pth = str(tmpdir.join('mixed.csv'))
+    write_mixed_csv(pth)
+
+    df = read_data(pth, typed=True)
+    plain = pd.read_csv(pth, low_memory=True)
+    assert df['Code'].tolist() == plain['Code'].tolist()
+    assert df['Code'].tolist()[:2] == [0, 1]
+
+
+@pytest.mark.skipif(sdg.data.pyarrow is None, reason='needs pyarrow')
+def test_parquet_build(test_site_dir, tmpdir):
+    """The parquet outputs hold the same data as the csvs"""
+    site_dir = str(tmpdir.mkdir('_site_parquet'))
+
+    build_result = build_data(src_dir=src_dir, site_dir=site_dir, git=False,
+                              parquet=True)
+    assert build_result
+
+    ids = get_ids(src_dir=src_dir)
+    rows = 0
+    for inid in ids:
+        for ftype in ['data', 'edges', 'headline']:
+            pq = pd.read_parquet(output_path(inid, ftype=ftype, format='parquet',
+                                             site_dir=site_dir))
+            csv = pd.read_csv(output_path(inid, ftype=ftype, format='csv',
+                                          site_dir=test_site_dir))
+            assert list(pq.columns) == list(csv.columns)
+            assert len(pq) == len(csv)
+        rows = rows + len(pq)
+
+    headline = pd.read_parquet(output_path('all', ftype='headline', format='parquet',
+                                           site_dir=site_dir))
+    assert headline.columns[0] == 'indicator'
+    assert set(headline['indicator']) <= set(ids)
+    assert len(headline) == rows
+
+
+def test_unchanged_outputs_skipped(tmpdir):
+    """Building again with the same inputs shouldn't touch any file"""
+    site_dir = str(tmpdir.mkdir('_site_skip'))
+
+    assert build_data(src_dir=src_dir, site_dir=site_dir, git=False)
+    mtimes = {f: os.stat(os.path.join(site_dir, f)).st_mtime_ns for f in read_site(site_dir)}
+
+    before = sdg.output.get_counts()
+    assert build_data(src_dir=src_dir, site_dir=site_dir, git=False)
+    after = sdg.output.get_counts()
+
+    assert after['written'] == before['written']
+    assert after['skipped'] - before['skipped'] == len(mtimes)
+    assert mtimes == {f: os.stat(os.path.join(site_dir, f)).st_mtime_ns
+                      for f in read_site(site_dir)}
+
+
+def test_profiled_build(test_site_dir, tmpdir):
+    """Profiling doesn't change the outputs and traces every indicator"""
+    site_dir = str(tmpdir.mkdir('_site_profiled'))
+    trace = os.path.join(str(tmpdir), 'trace.json')
+
+    assert build_data(src_dir=src_dir, site_dir=site_dir, git=False, profile=trace)
+    assert read_site(site_dir) == read_site(test_site_dir)
+    assert not sdg.profile.is_active()
+
+    with open(trace) as f:
+        events = json.load(f)['traceEvents']
+    indicators = set(e['args']['inid'] for e in events if e['name'] == 'indicator')
+    assert indicators == set(get_ids(src_dir=src_dir))
+    edges = [e for e in events if e['name'] == 'edges']
+    assert len(edges) == len(indicators)
+    assert all(e['args']['inid'] in indicators for e in edges)
+
+
+def test_chunked_build(test_site_dir, tmpdir):
+    """Streaming the csvs a few rows at a time gives the same site"""
+    site_dir = str(tmpdir.mkdir('_site_chunked'))
+
+    assert build_data(src_dir=src_dir, site_dir=site_dir, git=False, chunksize=50)
+    assert read_site(site_dir) == read_site(test_site_dir)
+
+
+def test_chunked_types(tmpdir):
+    """Every chunk is read with the type the whole column would have"""
+    pth = str(tmpdir.join('indicator_1-1-1.csv'))
+    with open(pth, 'w') as f:
+        f.write('Year,Sex,Flag,Code,Value\n'
+                '2015,,True,1,1\n'
+                '2016,,False,2,2\n'
+                '2015,F,True,3,3\n'
+                '2016,F,,A4,\n')
+
+    full_dir = str(tmpdir.join('full'))
+    chunked_dir = str(tmpdir.join('chunked'))
+    full = sdg.build.write_data_outputs('1-1-1', pd.read_csv(pth), site_dir=full_dir)
+    chunked = sdg.stream.write_data_chunked('1-1-1', pth, 2, site_dir=chunked_dir)
+
+    assert chunked == full
+    assert read_site(chunked_dir) == read_site(full_dir)
+
+
+def test_meta_cache_build(test_site_dir, tmpdir, monkeypatch):
+    """A second build with the cache doesn't parse any metadata"""
+    cache_file = os.path.join(str(tmpdir), 'meta.pickle')
+
+    site_dir = str(tmpdir.mkdir('_site_cache'))
+    assert build_data(src_dir=src_dir, site_dir=site_dir, git=False, workers=2,
+                      meta_cache=cache_file)
+    assert read_site(site_dir) == read_site(test_site_dir)
+
+    parsed = list()
+    read_meta_file = sdg.meta.read_meta_file
+
+    def count_parses(pth):
+        parsed.append(pth)
+        return read_meta_file(pth)
+    monkeypatch.setattr(sdg.meta, 'read_meta_file', count_parses)
+
+    site_dir = str(tmpdir.mkdir('_site_cached'))
+    assert build_data(src_dir=src_dir, site_dir=site_dir, git=False,
+                      meta_cache=cache_file)
+    assert read_site(site_dir) == read_site(test_site_dir)
+    assert parsed == []
+
+    # Without the cache every file is parsed
+    assert build_data(src_dir=src_dir, site_dir=site_dir, git=False)
+    assert len(parsed) == len(sdg.meta_cache.read_meta_cache(cache_file).entries)
+
+
+def test_profile_without_thread_time(monkeypatch):
+    """Python before 3.7 has no time.thread_time"""
+    monkeypatch.setattr(sdg.profile, 'cpu_time', time.process_time)
+    with sdg.profile.profiling():
+        with sdg.profile.stage('edges', '1-1-1'):
+            pass
+        events = sdg.profile._profiler.events
+    assert [e['name'] for e in events] == ['edges']
+
+
+def test_chunked_mixed_column(tmpdir):
+    """Streamed, a column mixing numbers with text is text in every chunk,
+    where an ordinary build has numbers in the blocks without text"""
+    pth = str(tmpdir.join('indicator_1-1-1.csv'))
+    write_mixed_csv(pth)
+
+    site_dir = str(tmpdir.join('chunked'))
+    assert sdg.stream.write_data_chunked('1-1-1', pth, 100000, site_dir=site_dir)[0]
+    with open(output_path('1-1-1', ftype='data', format='json', site_dir=site_dir)) as f:
+        code = json.load(f)['Code']
+    assert code[:2] == ['0', '1']
+    assert code[-1] == 'A4'
+    assert set(type(value) for value in code) == set([str])
@@ -1,10 +1,54 @@
 import pytest
 import os
+import numpy as np
+import pandas as pd
+import xml.etree.ElementTree as ET
 from sdg import check_all_csv
+from sdg.check_csv import validate
 
 src_dir = os.path.dirname(os.path.realpath(__file__))
 
 def test_out_path():
     """Check that we can check csvs"""
     check_result = check_all_csv(src_dir=os.path.realpath(src_dir))
-    assert check_result
\ No newline at end of file
+    assert check_result
+
+
+def test_validate_results():
+    """Each problem should come back with the rows it was found on"""
+    df = pd.DataFrame({'Year': [2015, 2016, np.nan],
+                       'Sex': ['Male ', ' Female', np.nan],
+                       'Value': [1.0, 2.0, np.nan]})
+    results = validate(df, 'test.csv')
+
+    checks = [(res.check, res.column, list(res.rows)) for res in results]
+    assert checks == [('trailing_whitespace', 'Sex', [0]),
+                      ('leading_whitespace', 'Sex', [1]),
+                      ('empty_rows', None, [2])]
+    assert results[0].message == 'test.csv : Trailing whitespace in column:  Sex'
+
+
+
+def test_validate_no_strings():
+    """A column with nothing pandas can treat as strings fails, after the
+    first check of the columns before it, as it always has"""
+    df = pd.DataFrame({'Year': [2015, 2016],
+                       'Sex': ['Male ', np.nan],
+                       'Flag': [True, np.nan],
+                       'Value': [1.0, 2.0]})
+    results = validate(df, 'test.csv')
+
+    checks = [(res.check, res.column) for res in results]
+    assert checks == [('trailing_whitespace', 'Sex'), ('string_column', 'Flag')]
+    assert results[1].message.startswith('test.csv Can only use .str accessor')
+
+def test_junit_report(tmpdir):
+    """A JUnit report has a test case per csv and a failure per problem"""
+    report = os.path.join(str(tmpdir), 'csv.xml')
+    check_result = check_all_csv(src_dir=os.path.realpath(src_dir), workers=2,
+                                 report=report)
+    assert check_result
+
+    suite = ET.parse(report).getroot()
+    assert suite.get('tests') == '15'
+    assert suite.get('failures') == '0'
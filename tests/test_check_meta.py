@@ -1,6 +1,9 @@
 import pytest
 import os
+import json
 from sdg import check_all_meta
+from sdg.check_metadata import validate_meta
+from sdg.meta_cache import MetaCache
 
 src_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -8,3 +11,52 @@ def test_out_path():
     """Check that output_path is as expected"""
     check_result = check_all_meta(src_dir=os.path.realpath(src_dir))
     assert check_result
+
+
+def test_parallel_check_report(tmpdir):
+    """Checking in parallel should pass too and write a report"""
+    report = os.path.join(str(tmpdir), 'meta.json')
+    check_result = check_all_meta(src_dir=os.path.realpath(src_dir), workers=2,
+                                  pool='thread', report=report)
+    assert check_result
+
+    with open(report) as f:
+        results = json.load(f)
+    assert results['status']
+    assert len(results['files']) == 15
+
+
+def test_validate_meta():
+    """Problems come back as results with the printed message"""
+    results = validate_meta({'reporting_status': 'bad', 'published': True}, 'f.md')
+    assert [res.check for res in results] == ['reporting_status']
+    assert results[0].column == 'reporting_status'
+    assert results[0].message.startswith('invalid reporting_status in f.md: bad')
+
+
+def test_meta_cache(tmpdir):
+    """Only files whose contents changed are parsed again"""
+    met = str(tmpdir.join('meta.md'))
+    with open(met, 'w') as f:
+        f.write('---\nreporting_status: complete\n---\n')
+    parsed = list()
+
+    def parser(pth):
+        parsed.append(pth)
+        return {'reporting_status': 'complete'}
+
+    cache = MetaCache(str(tmpdir))
+    cache.parse(met, parser, kind='yaml')
+    cache.parse(met, parser, kind='yaml')
+    assert len(parsed) == 1
+
+    # Touched but the same
+    os.utime(met, ns=(0, 0))
+    cache.parse(met, parser, kind='yaml')
+    assert len(parsed) == 1
+
+    with open(met, 'a') as f:
+        f.write('Changed\n')
+    cache.parse(met, parser, kind='yaml')
+    assert len(parsed) == 2
+    assert list(cache.entries) == ['meta.md']
@@ -8,6 +8,7 @@ Unit tests written retrospectively for the edge detection function (a fairly com
 
 import sdg
 import pytest
+import pandas as pd
 import os
 
 src_dir = os.path.dirname(os.path.realpath(__file__))
@@ -52,4 +53,22 @@ def parent_has_child(edges, parent, child):
     """
     parents = edges.query('From == "' + parent + '"')
     children = parents.get('To')   
-    return child in children.unique()
\ No newline at end of file
+    return child in children.unique()
+
+def test_present_without():
+    """Tests the pairwise comparison of missing values against x_without_y"""
+    inid = "5-2-2"
+    data = sdg.data.get_inid_data(inid, src_dir=src_dir)
+    cols = data.columns
+    without = sdg.nulls.NullStructure(data).present_without()
+    for i, x in enumerate(cols):
+        for j, y in enumerate(cols):
+            assert without[i, j] == sdg.edges.x_without_y(data[x], data[y])
+
+
+def test_prune_grand_parents_cycle():
+    """Edges that go round in a circle can't be pruned and should raise
+    rather than loop forever"""
+    edges = pd.DataFrame({'From': ['A', 'B', 'C'], 'To': ['B', 'C', 'A']})
+    with pytest.raises(ValueError):
+        sdg.edges.prune_grand_parents(edges)
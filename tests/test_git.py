@@ -0,0 +1,214 @@
+import os
+import json
+import shutil
+import git
+import pytest
+import pandas as pd
+import sdg
+from sdg import build_data
+from sdg.path import output_path
+from sdg.git import get_git_update, get_git_index, lookup_git_update, read_git_cache
+
+IDS = ['1-1-1', '1-2-1']
+
+
+def identity(date=None):
+    """Who commits and when, in the committer's own timezone"""
+    people = {'NAME': 'Test', 'EMAIL': 'test@example.com'}
+    if date is not None:
+        people['DATE'] = date
+    env = dict()
+    for role in ['AUTHOR', 'COMMITTER']:
+        for k, v in people.items():
+            env['GIT_%s_%s' % (role, k)] = v
+    return env
+
+
+def commit(repo, message, date, *args):
+    """Commit what is staged"""
+    repo.git.commit('-m', message, *args, env=identity(date))
+    return repo.head.commit.hexsha
+
+
+def write(repo, pth, text):
+    full = os.path.join(repo.working_dir, pth)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, 'w') as f:
+        f.write(text)
+    repo.git.add(pth)
+
+
+@pytest.fixture
+def project(tmpdir):
+    """A project with a few commits, a rename, two merges, one resolving a
+    conflict, and committers in different timezones"""
+    repo = git.Repo.init(str(tmpdir))
+    repo.create_remote('origin', 'https://github.com/owner/project.git')
+
+    write(repo, 'meta/1-1-1.md', 'one\n')
+    write(repo, 'meta/1-9-9.md', 'two\n')
+    write(repo, 'data/indicator_1-1-1.csv', 'Year,Value\n2015,1\n')
+    write(repo, 'data/indicator_1-2-1.csv', 'Year,Value\n2015,2\n')
+    commit(repo, 'Start', '2018-01-01T12:00:00+00:00')
+
+    # The next day in UTC
+    repo.git.mv('meta/1-9-9.md', 'meta/1-2-1.md')
+    commit(repo, 'Rename', '2018-02-01T23:30:00-05:00')
+
+    # The day before in UTC
+    write(repo, 'data/indicator_1-1-1.csv', 'Year,Value\n2015,3\n')
+    commit(repo, 'Data', '2018-03-01T01:00:00+09:00')
+
+    main = repo.active_branch
+    side = repo.create_head('side')
+    side.checkout()
+    write(repo, 'meta/1-1-1.md', 'one again\n')
+    commit(repo, 'Side', '2018-04-01T10:00:00+02:00')
+    main.checkout()
+    write(repo, 'data/indicator_1-2-1.csv', 'Year,Value\n2015,4\n')
+    commit(repo, 'Main', '2018-04-02T10:00:00-08:00')
+    repo.git.merge('--no-ff', '-m', 'Merge', 'side', env=identity())
+
+    # A conflict resolved by hand, so the merge changes the file itself
+    other = repo.create_head('other')
+    other.checkout()
+    write(repo, 'data/indicator_1-2-1.csv', 'Year,Value\n2015,5\n')
+    commit(repo, 'Other', '2018-04-03T10:00:00+00:00')
+    main.checkout()
+    write(repo, 'data/indicator_1-2-1.csv', 'Year,Value\n2015,6\n')
+    commit(repo, 'Conflicting', '2018-04-04T10:00:00+00:00')
+    with pytest.raises(git.exc.GitCommandError):
+        repo.git.merge('other', env=identity())
+    write(repo, 'data/indicator_1-2-1.csv', 'Year,Value\n2015,7\n')
+    commit(repo, 'Resolve', '2018-04-05T23:00:00-03:00')
+
+    return repo
+
+
+def test_git_index(project):
+    """The index gives the same last update as asking git about each file"""
+    src_dir = project.working_dir
+    git_index = get_git_index(src_dir=src_dir)
+
+    for inid in IDS:
+        for ftype in ['meta', 'data']:
+            expected = get_git_update(inid, ftype, src_dir=src_dir)
+            update = lookup_git_update(inid, ftype, git_index, src_dir=src_dir)
+            for k in ['date', 'sha', 'id', 'commit_url']:
+                assert update[k] == expected[k]
+            assert update['file'] == expected['file'].replace(os.sep, '/')
+
+    update = lookup_git_update('1-2-1', 'meta', git_index, src_dir=src_dir)
+    assert update['date'] == '2018-02-01'
+    update = lookup_git_update('1-1-1', 'data', git_index, src_dir=src_dir)
+    assert update['date'] == '2018-03-01'
+    update = lookup_git_update('1-2-1', 'data', git_index, src_dir=src_dir)
+    assert update['date'] == '2018-04-05'
+    assert update['sha'] == project.head.commit.hexsha
+
+
+def updates_of(git_index):
+    return {f: (u['date'], u['sha']) for f, u in git_index.items()}
+
+
+def watch_walks(monkeypatch):
+    """Record the since argument of every walk of the git log"""
+    walks = list()
+    walk = sdg.git.get_repo_updates
+
+    def get_repo_updates(repo, paths=None, since=None):
+        walks.append(since)
+        return walk(repo, paths=paths, since=since)
+    monkeypatch.setattr(sdg.git, 'get_repo_updates', get_repo_updates)
+    return walks
+
+
+def test_git_cache(project, tmpdir, monkeypatch):
+    """The cache is used as it is while HEAD stays put, and only new commits
+    are walked once it moves on"""
+    src_dir = project.working_dir
+    cache_file = str(tmpdir.join('cache', 'git.json'))
+    walks = watch_walks(monkeypatch)
+
+    first = get_git_index(src_dir=src_dir, cache_file=cache_file)
+    assert walks == [None]
+    assert get_git_index(src_dir=src_dir, cache_file=cache_file) == first
+    assert walks == [None]
+
+    head = project.head.commit.hexsha
+    write(project, 'meta/1-2-1.md', 'two again\n')
+    sha = commit(project, 'More', '2018-05-01T10:00:00+05:30')
+    cached = get_git_index(src_dir=src_dir, cache_file=cache_file)
+    assert walks == [None, head]
+    assert updates_of(cached)[os.path.join(src_dir, 'meta', '1-2-1.md')] == ('2018-05-01', sha)
+    assert updates_of(cached) == updates_of(get_git_index(src_dir=src_dir))
+
+
+def test_git_cache_rewritten(project, tmpdir, monkeypatch):
+    """After an amend or rebase the cached HEAD isn't an ancestor any more,
+    so the whole log is walked again"""
+    src_dir = project.working_dir
+    cache_file = str(tmpdir.join('git.json'))
+    get_git_index(src_dir=src_dir, cache_file=cache_file)
+    walks = watch_walks(monkeypatch)
+
+    write(project, 'data/indicator_1-1-1.csv', 'Year,Value\n2015,5\n')
+    commit(project, 'Amended', '2018-06-01T10:00:00+00:00', '--amend')
+    cached = get_git_index(src_dir=src_dir, cache_file=cache_file)
+    assert walks == [None]
+    assert updates_of(cached) == updates_of(get_git_index(src_dir=src_dir))
+
+    # A HEAD that isn't in the clone at all
+    with open(cache_file) as f:
+        cache = json.load(f)
+    for updates in cache['repos'].values():
+        updates['head'] = '0' * 40
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f)
+    walks[:] = []
+    assert get_git_index(src_dir=src_dir, cache_file=cache_file) == cached
+    assert walks == [None]
+
+
+def test_git_cache_corrupt(project, tmpdir):
+    """A cache file that can't be read is started again"""
+    src_dir = project.working_dir
+    cache_file = str(tmpdir.join('git.json'))
+    with open(cache_file, 'wb') as f:
+        f.write(b'{"repos": \xff')
+
+    git_index = get_git_index(src_dir=src_dir, cache_file=cache_file)
+    assert git_index == get_git_index(src_dir=src_dir)
+    assert read_git_cache(cache_file)['repos']
+
+
+def test_incremental_build_new_commit(tmpdir):
+    """A commit that changes no file still rebuilds the indicators whose git
+    fields it changes"""
+    test_dir = os.path.dirname(os.path.realpath(__file__))
+    src_dir = str(tmpdir.join('project'))
+    site_dir = str(tmpdir.join('_site'))
+    for folder in ['data', 'meta']:
+        shutil.copytree(os.path.join(test_dir, folder), os.path.join(src_dir, folder))
+    shutil.copy(os.path.join(test_dir, '_prose.yml'), src_dir)
+    repo = git.Repo.init(src_dir)
+    repo.create_remote('origin', 'https://github.com/owner/project.git')
+    repo.git.add('.')
+    commit(repo, 'Start', '2018-01-01T12:00:00+00:00')
+
+    def meta_url():
+        with open(output_path('1-2-1', ftype='meta', site_dir=site_dir)) as f:
+            return json.load(f)['national_data_update_url']
+
+    # Built before the edit is committed
+    csv_path = os.path.join(src_dir, 'data', 'indicator_1-2-1.csv')
+    df = pd.read_csv(csv_path)
+    df['Value'] = df['Value'] + 1
+    df.to_csv(csv_path, index=False)
+    assert build_data(src_dir=src_dir, site_dir=site_dir, incremental=True)
+    first = meta_url()
+
+    sha = commit(repo, 'Edit', '2018-02-01T12:00:00+00:00', '-a')
+    assert build_data(src_dir=src_dir, site_dir=site_dir, incremental=True)
+    assert meta_url() != first
+    assert meta_url().endswith(sha)
@@ -0,0 +1,54 @@
+import pytest
+import os
+import numpy as np
+import pandas as pd
+from sdg.data import get_inid_data
+from sdg.json import df_to_json, df_to_list_dict, dumps, join_object
+from sdg.json import JSONObjectWriter
+from sdg.path import get_ids
+
+src_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.mark.parametrize('orient', ['list', 'records'])
+def test_df_to_json_test_data(orient):
+    """The columnar encoder should match encoding the dicts"""
+    for inid in get_ids(src_dir=src_dir):
+        df = get_inid_data(inid, src_dir=src_dir)
+        assert df_to_json(df, orient) == dumps(df_to_list_dict(df, orient))
+
+
+@pytest.mark.parametrize('orient', ['list', 'records'])
+def test_df_to_json_awkward(orient):
+    """Missing values, escaping and mixed types"""
+    df = pd.DataFrame({
+        'Year': [2015, 2016, 2017, 2018],
+        'Sex/Gender': ['Male', None, 'Féminin', 'a "quote"'],
+        'Mixed': [1, 1.0, True, np.nan],
+        'Value': [1.5, np.nan, 3.0, 1e20]})
+    assert df_to_json(df, orient) == dumps(df_to_list_dict(df, orient))
+
+
+def test_df_to_json_empty():
+    df = pd.DataFrame(columns=['Year', 'Value'])
+    assert df_to_json(df, 'records') == '[]'
+
+
+def test_join_object():
+    """Joining encoded values is the same as encoding the whole object"""
+    obj = {'data': {'Year': [2015], 'Value': [1.5]}, 'edges/1': [], 'é': None}
+    joined = join_object((key, dumps(value)) for key, value in obj.items())
+    assert joined == dumps(obj)
+
+
+def test_json_object_writer(tmpdir):
+    """Streaming an object out gives the same file as encoding it whole"""
+    site_dir = str(tmpdir)
+    obj = {'1-1-1': {'title': 'a/b'}, '1-1-2': [1, None]}
+    with JSONObjectWriter('all', ftype='meta', site_dir=site_dir) as writer:
+        for key, value in obj.items():
+            writer.add(key, dumps(value))
+
+    with open(os.path.join(site_dir, 'meta', 'all.json'), encoding='utf-8') as f:
+        assert f.read() == dumps(obj)
+    assert os.listdir(os.path.join(site_dir, 'meta')) == ['all.json']
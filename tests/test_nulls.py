@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pandas as pd
+import sdg
+from sdg.nulls import NullStructure
+
+src_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+def test_null_structure():
+    """The packed masks agree with pandas, across word boundaries"""
+    rng = np.random.RandomState(0)
+    for rows in [0, 1, 63, 64, 65, 200]:
+        df = pd.DataFrame({'Year': np.arange(rows),
+                           'A': np.where(rng.uniform(size=rows) < 0.5, 'a', None),
+                           'B': np.where(rng.uniform(size=rows) < 0.2, 1.0, np.nan),
+                           'Value': np.nan})
+        notnull = df.notnull().values
+        nulls = NullStructure(df)
+
+        for i in range(df.shape[1]):
+            assert (nulls.present(i) == notnull[:, i]).all()
+        assert (nulls.any_present() == notnull.any(axis=1)).all()
+        assert (nulls.any_present(['A', 'B']) == notnull[:, 1:3].any(axis=1)).all()
+        assert (nulls.not_empty() == notnull.any(axis=0)).all()
+        without = nulls.present_without()
+        for i, x in enumerate(df.columns):
+            for j, y in enumerate(df.columns):
+                assert without[i, j] == sdg.edges.x_without_y(df[x], df[y])
+
+
+def test_null_structure_shared():
+    """The headline and edges are the same from a NullStructure"""
+    inid = '5-2-2'
+    data = sdg.data.get_inid_data(inid, src_dir=src_dir)
+    nulls = NullStructure(data)
+
+    headline = sdg.data.filter_headline(data, nulls=nulls)
+    disag = data.drop(['Year', 'Value'], axis=1)
+    assert headline.equals(data.filter(['Year', 'Value'])[disag.isnull().all(axis=1)])
+
+    edges = sdg.edges.edge_detection(inid, data, nulls=nulls)
+    assert edges.equals(sdg.edges.edge_detection(inid, data))
@@ -0,0 +1,52 @@
+import pytest
+import os
+from sdg.output import write_bytes, atomic_path, get_counts
+
+
+def test_write_bytes(tmpdir):
+    """Only changed content is written"""
+    pth = str(tmpdir.join('out.json'))
+
+    assert write_bytes(pth, b'[1]')
+    assert not write_bytes(pth, b'[1]')
+    assert write_bytes(pth, b'[2]')
+    with open(pth, 'rb') as f:
+        assert f.read() == b'[2]'
+    assert os.listdir(str(tmpdir)) == ['out.json']
+
+
+def test_atomic_path_failure(tmpdir):
+    """A failed write leaves the old file and no temporary file"""
+    pth = str(tmpdir.join('out.csv'))
+    write_bytes(pth, b'a,b\n')
+    before = get_counts()
+
+    with pytest.raises(ValueError):
+        with atomic_path(pth) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                f.write('half')
+            raise ValueError('failed')
+
+    with open(pth, 'rb') as f:
+        assert f.read() == b'a,b\n'
+    assert os.listdir(str(tmpdir)) == ['out.csv']
+    assert get_counts() == before
+
+
+def test_temp_paths_unique(tmpdir):
+    """Two writers of the same output don't share a temporary file, and the
+    output gets the usual permissions"""
+    pth = str(tmpdir.join('out.json'))
+    with atomic_path(pth) as first, atomic_path(pth) as second:
+        assert first != second
+        with open(first, 'w') as f:
+            f.write('[1]')
+        with open(second, 'w') as f:
+            f.write('[2]')
+
+    with open(pth) as f:
+        assert f.read() == '[1]'
+    assert os.listdir(str(tmpdir)) == ['out.json']
+    umask = os.umask(0)
+    os.umask(umask)
+    assert os.stat(pth).st_mode & 0o777 == 0o666 & ~umask
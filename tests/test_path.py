@@ -12,3 +12,61 @@ def test_in_path():
     """Check input path as expected"""
     in_path = input_path(inid="1-2-1", ftype='meta', src_dir = '')
     assert in_path == os.path.join('meta','1-2-1.md')
+
+def test_build_context(tmpdir):
+    """The context gives the same paths and makes each directory once"""
+    site_dir = str(tmpdir.join('_site'))
+    src_dir = os.path.dirname(os.path.realpath(__file__))
+    context = sdg.context.BuildContext(src_dir=src_dir, site_dir=site_dir)
+
+    pth = context.output_path('1-2-1', ftype='edges', format='csv')
+    assert pth == output_path(inid='1-2-1', ftype='edges', format='csv', site_dir=site_dir)
+    assert os.path.isdir(os.path.dirname(pth))
+    assert list(context.output_dirs) == [('edges', 'csv')]
+    assert context.languages == []
+
+def test_scan_project(tmpdir):
+    """The index knows which files each indicator has"""
+    src_dir = str(tmpdir)
+    for pth in ['meta/1-1-1.md', 'meta/1-2-1.md', 'meta/fr/1-1-1.md', 'meta/fr/9-9-9.md',
+                'data/indicator_1-1-1.csv', 'data/indicator_2-1-1.csv']:
+        tmpdir.join(pth).ensure()
+
+    index = sdg.path.scan_project(src_dir=src_dir)
+    assert sorted(index.ids) == sorted(sdg.path.get_ids(src_dir=src_dir)) == ['1-1-1', '1-2-1']
+    assert index.languages == ['fr']
+    assert index.missing_data() == ['1-2-1']
+    assert index.orphaned_data() == ['2-1-1']
+    assert index.orphaned_translations() == {'fr': ['9-9-9']}
+    assert index.translation_paths('1-1-1') == [('fr', os.path.join(src_dir, 'meta', 'fr', '1-1-1.md'))]
+    assert index.translation_paths('1-2-1') == []
+
+def test_in_path_must_work(tmpdir):
+    """must_work raises if the file isn't there"""
+    with pytest.raises(IOError):
+        input_path(inid="1-2-1", ftype='data', src_dir=str(tmpdir), must_work=True)
+
+def test_list_dir_without_scandir(tmpdir, monkeypatch):
+    """Python 3.4 has no os.scandir, the index must be the same without it"""
+    for pth in ['meta/1-1-1.md', 'meta/fr/1-1-1.md', 'data/indicator_1-1-1.csv']:
+        tmpdir.join(pth).ensure()
+    index = sdg.path.scan_project(src_dir=str(tmpdir))
+
+    monkeypatch.delattr(os, 'scandir')
+    entries = sdg.path.list_dir(str(tmpdir.join('meta')))
+    assert sorted((e.name, e.is_dir(), e.is_file()) for e in entries) == \
+        [('1-1-1.md', False, True), ('fr', True, False)]
+    assert vars(sdg.path.scan_project(src_dir=str(tmpdir))) == vars(index)
+
+def test_index_subset(tmpdir):
+    """A subset of the index answers the same for its own indicators"""
+    for pth in ['meta/1-1-1.md', 'meta/1-2-1.md', 'meta/fr/1-1-1.md', 'meta/fr/1-2-1.md',
+                'data/indicator_1-1-1.csv', 'data/indicator_1-2-1.csv']:
+        tmpdir.join(pth).ensure()
+    index = sdg.path.scan_project(src_dir=str(tmpdir))
+
+    subset = index.subset(['1-1-1'])
+    assert subset.ids == ['1-1-1']
+    assert subset.data_ids == set(['1-1-1'])
+    assert subset.translations == {'fr': set(['1-1-1'])}
+    assert subset.translation_paths('1-1-1') == index.translation_paths('1-1-1')
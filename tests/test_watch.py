@@ -0,0 +1,40 @@
+import pytest
+import os
+import json
+import shutil
+from sdg.watch import Watcher, snapshot
+from sdg.path import output_path
+
+src_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+def test_watch_update(tmpdir):
+    """Only the changed indicator is rebuilt and the "all" output follows"""
+    project = str(tmpdir.join('project'))
+    site_dir = str(tmpdir.join('_site'))
+    for folder in ['data', 'meta']:
+        shutil.copytree(os.path.join(src_dir, folder), os.path.join(project, folder))
+    shutil.copy(os.path.join(src_dir, '_prose.yml'), project)
+
+    watcher = Watcher(src_dir=project, site_dir=site_dir, git=False)
+    assert watcher.build()
+    assert watcher.update() == []
+
+    meta_path = os.path.join(project, 'meta', '9-3-1.md')
+    with open(meta_path, encoding='utf-8') as f:
+        meta = f.read()
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        f.write(meta.replace('indicator: 9.3.1', 'indicator: 9.3.1 (edited)'))
+
+    assert watcher.update() == ['9-3-1']
+    with open(output_path('all', ftype='meta', format='json', site_dir=site_dir)) as f:
+        all_meta = json.load(f)
+    assert all_meta['9-3-1']['indicator'] == '9.3.1 (edited)'
+    assert all_meta['1-2-1']['indicator'] == '1.2.1'
+
+
+def test_snapshot_missing_folders(tmpdir):
+    """A project without a meta folder yet has nothing to watch"""
+    assert snapshot(str(tmpdir)) == {}
+    tmpdir.join('data', 'indicator_1-1-1.csv').ensure()
+    assert list(snapshot(str(tmpdir))) == [os.path.join(str(tmpdir), 'data', 'indicator_1-1-1.csv')]
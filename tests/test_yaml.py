@@ -0,0 +1,25 @@
+import os
+import glob
+import yaml
+import sdg
+from sdg.meta import read_meta_file
+
+src_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+def test_meta_files():
+    """The front matter is what the pure Python loader gives"""
+    mets = glob.glob(os.path.join(src_dir, 'meta', '**', '*.md'), recursive=True)
+    assert len(mets) > 0
+    for met in mets:
+        with open(met, encoding='utf-8') as f:
+            text = f.read()
+        meta, content = read_meta_file(met)
+        assert meta == next(yaml.load_all(text, Loader=yaml.SafeLoader))
+        assert text.endswith(''.join(content))
+
+
+def test_safe_load():
+    text = "a: 1\nb: [x, 'y']\nc: 2018-01-01\n---\nnot: [yaml"
+    assert next(sdg.yaml.safe_load_all(text)) == next(yaml.safe_load_all(text))
+    assert sdg.yaml.safe_load('a: 1') == {'a': 1}